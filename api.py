@@ -0,0 +1,74 @@
+"""JSON API каталога: /api/v1.
+
+Ответы сериализуются через orjson без промежуточного jsonable_encoder;
+схемы указаны в response_model только для документации OpenAPI.
+"""
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy import select
+
+from config import API_MAX_PAGE_SIZE, API_PAGE_SIZE, EXPORT_CHUNK_SIZE
+from database import AsyncSession, async_session_maker, get_read_session, replica_health, replica_session_maker
+from models import CategoryEnum, Furniture
+from pagination import decode_cursor, encode_cursor
+from schemas import FurnitureItemResponse, FurnitureListResponse
+
+api_router = APIRouter(prefix="/api/v1", default_response_class=ORJSONResponse)
+
+ITEM_COLUMNS = (
+    Furniture.c.id, Furniture.c.fullname, Furniture.c.description, Furniture.c.price, Furniture.c.category,
+    Furniture.c.material, Furniture.c.manufacturer, Furniture.c.image_url,
+)
+
+
+def item_dict(row) -> dict:
+    # Enum-ы orjson отдаёт их значениями ("table", "wood"), как и pydantic
+    return dict(row._mapping)
+
+
+@api_router.get("/furniture", response_model=FurnitureListResponse)
+async def list_furniture(category: Optional[CategoryEnum] = None,
+                           cursor: Optional[str] = None,
+                            limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+                             session: AsyncSession = Depends(get_read_session)):
+    stmt = select(*ITEM_COLUMNS).order_by(Furniture.c.id).limit(limit)
+    if category is not None:
+        stmt = stmt.where(Furniture.c.category == category)
+    key, _ = decode_cursor(cursor, (int,))
+    if key is not None:
+        stmt = stmt.where(Furniture.c.id > key[0])
+    result = await session.execute(stmt)
+    rows = result.fetchall()
+    next_cursor = encode_cursor((rows[-1].id,)) if len(rows) == limit else None
+    return ORJSONResponse({"data": [item_dict(row) for row in rows], "next_cursor": next_cursor})
+
+
+@api_router.get("/furniture/{furniture_id}", response_model=FurnitureItemResponse)
+async def get_furniture(furniture_id: int, session: AsyncSession = Depends(get_read_session)):
+    result = await session.execute(select(*ITEM_COLUMNS).where(Furniture.c.id == furniture_id))
+    row = result.fetchone()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    return ORJSONResponse({"data": item_dict(row)})
+
+
+async def export_rows():
+    # Сессия открывается внутри генератора: зависимости FastAPI закрываются
+    # раньше, чем StreamingResponse дочитает тело
+    use_replica = replica_session_maker is not None and await replica_health.is_usable()
+    async with (replica_session_maker if use_replica else async_session_maker)() as session:
+        # Серверный курсор: в памяти только текущая пачка из EXPORT_CHUNK_SIZE строк
+        stmt = select(*ITEM_COLUMNS).order_by(Furniture.c.id).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        result = await session.stream(stmt)
+        async for rows in result.partitions():
+            yield b"".join(orjson.dumps(item_dict(row)) + b"\n" for row in rows)
+
+
+@api_router.get("/export.ndjson", response_class=StreamingResponse)
+async def export_catalog():
+    return StreamingResponse(export_rows(), media_type="application/x-ndjson", headers={
+        "Content-Disposition": 'attachment; filename="furniture.ndjson"',
+    })
@@ -0,0 +1,157 @@
+"""Сборка и раздача статики с хэшем содержимого в имени.
+
+    python assets.py build
+
+Кладёт в static/dist/ копии файлов вида index.<hash>.css, рядом .gz и .br
+(если установлен brotli), и manifest.json с соответствием исходных имён.
+Шаблоны получают адреса через {{ asset_url('index.css') }}; без сборки
+функция возвращает обычный /static/<имя>, так что разработка работает и так.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: тогда собираются только .gz
+    brotli = None
+
+STATIC_DIR = "static"
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+STATIC_URL = "/static"
+COMPRESSIBLE = {".css", ".js", ".svg", ".html", ".json", ".txt"}
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def build_assets(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.makedirs(dist_dir)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [name for name in dirs if os.path.join(root, name) != dist_dir]
+        for name in files:
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            with open(source, "rb") as file:
+                content = file.read()
+            stem, ext = os.path.splitext(relative)
+            hashed = f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+            target = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as file:
+                file.write(content)
+            if ext.lower() in COMPRESSIBLE:
+                with open(target + ".gz", "wb") as file:
+                    file.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + ".br", "wb") as file:
+                        file.write(brotli.compress(content, quality=11))
+            manifest[relative] = hashed
+
+    with open(os.path.join(dist_dir, MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return manifest
+
+
+_manifest: Optional[Dict[str, str]] = None
+
+
+def load_manifest(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    global _manifest
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST)) as file:
+            _manifest = json.load(file)
+    except FileNotFoundError:
+        _manifest = {}
+    return _manifest
+
+
+def asset_url(name: str) -> str:
+    manifest = _manifest if _manifest is not None else load_manifest()
+    hashed = manifest.get(name)
+    if hashed is None:
+        return f"{STATIC_URL}/{name}"
+    return f"{STATIC_URL}/{DIST_DIR}/{hashed}"
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    accepted = []
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.append(token)
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding in accepted]
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles, отдающий сжатые варианты из dist/ с immutable-кэшированием.
+
+    Файлы вне dist/ отдаются как раньше, но с Cache-Control: no-cache, чтобы
+    браузер перепроверял их по ETag.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dist_dir = os.path.realpath(os.path.join(str(self.directory), DIST_DIR)) + os.sep
+        # путь файла -> доступные сжатые варианты; файлы в dist/ неизменны, проверяем диск один раз
+        self._variants: Dict[str, Dict[str, os.stat_result]] = {}
+
+    def variants(self, full_path: str) -> Dict[str, os.stat_result]:
+        variants = self._variants.get(full_path)
+        if variants is None:
+            variants = {}
+            for encoding, suffix in ENCODING_SUFFIXES.items():
+                try:
+                    variants[encoding] = os.stat(full_path + suffix)
+                except FileNotFoundError:
+                    pass
+            self._variants[full_path] = variants
+        return variants
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        full_path = os.path.realpath(full_path)
+        if not full_path.startswith(self.dist_dir) or status_code != 200:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+            response.headers.setdefault("Cache-Control", REVALIDATE)
+            return response
+
+        variants = self.variants(full_path)
+        headers = {"Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding"}
+        for encoding in accepted_encodings(Headers(scope=scope).get("accept-encoding", "")):
+            if encoding in variants:
+                media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+                headers["Content-Encoding"] = encoding
+                return FileResponse(
+                    full_path + ENCODING_SUFFIXES[encoding],
+                    stat_result=variants[encoding],
+                    media_type=media_type,
+                    headers=headers,
+                )
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers.update(headers)
+        return response
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["build"]:
+        sys.exit("usage: python assets.py build")
+    built = build_assets()
+    print(f"Built {len(built)} assets into {os.path.join(STATIC_DIR, DIST_DIR)}" + ("" if brotli else " (brotli not installed, gzip only)"))
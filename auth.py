@@ -1,19 +1,35 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Annotated
+import time
+from typing import Annotated, NamedTuple, Optional
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
 from passlib.context import CryptContext
-from sqlalchemy import delete, insert, select
-from database import AsyncSession, get_async_session
-from models import User
+from sqlalchemy import delete, insert, select, update
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_QUEUE_LIMIT, PASSWORD_HASH_WORKERS, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL
+from database import AsyncSession, async_session_maker, get_async_session
+from models import StatusEnum, User
 # from jose import JWTError
 
 SECRET_KEY = "SECRET"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min/max rounds = rounds: хэш с другой стоимостью считается устаревшим и перехэшируется при логине
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt отпускает GIL, поэтому пула потоков достаточно, чтобы не блокировать event loop
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending_hash_jobs = 0
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
@@ -21,6 +37,28 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def run_in_hash_executor(func, *args):
+    global _pending_hash_jobs
+    if _pending_hash_jobs >= PASSWORD_HASH_QUEUE_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, try again later",
+            headers={"Retry-After": "1"},
+        )
+    _pending_hash_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_executor, func, *args)
+    finally:
+        _pending_hash_jobs -= 1
+
+async def hash_password(password: str) -> str:
+    return await run_in_hash_executor(get_password_hash, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    # Возвращает (совпал ли пароль, новый хэш или None если перехэширование не нужно)
+    return await run_in_hash_executor(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MINUTES):
     to_encode = data.copy()
     to_encode.update({"exp": datetime.utcnow() + timedelta(minutes=expires_delta)})
@@ -28,30 +66,148 @@ def create_access_token(data: dict, expires_delta: int = ACCESS_TOKEN_EXPIRE_MIN
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], session: AsyncSession = Depends(get_async_session)):
-    print(f"Token received: {token}")
+class Principal(NamedTuple):
+    id: int
+    email: str
+    status: StatusEnum
+
+
+class TokenCache:
+    """LRU проверенных токенов -> Principal.
+
+    Запись живёт до exp токена, но не дольше TOKEN_CACHE_TTL, чтобы смена
+    статуса пользователя в другом воркере подхватывалась без ручного сброса;
+    в своём воркере записи пользователя сразу сбрасывает revoke_user.
+    Отозванные токены помнятся до своего exp и повторно не принимаются.
+    """
+
+    def __init__(self, maxsize: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, Principal]] = OrderedDict()
+        self._revoked: OrderedDict[str, float] = OrderedDict()
+        # user_id -> его токены в _entries, для revoke_user; чистится вместе с _entries
+        self._by_user: dict[int, set[str]] = {}
+
+    def get(self, token: str) -> Optional[Principal]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at <= time.time():
+            self._drop(token)
+            return None
+        self._entries.move_to_end(token)
+        return principal
+
+    def put(self, token: str, principal: Principal, token_exp: float) -> None:
+        self._drop(token)
+        self._entries[token] = (min(token_exp, time.time() + self.ttl), principal)
+        self._by_user.setdefault(principal.id, set()).add(token)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._by_user.get(entry[1].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._by_user[entry[1].id]
+
+    def is_revoked(self, token: str) -> bool:
+        expires_at = self._revoked.get(token)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            del self._revoked[token]
+            return False
+        return True
+
+    def revoke_token(self, token: str, token_exp: Optional[float] = None) -> None:
+        self._drop(token)
+        now = time.time()
+        # Токены живут одинаково, поэтому отозванные истекают почти в порядке добавления:
+        # истёкшие снимаются с начала, и словарь не растёт дольше времени жизни токена
+        while self._revoked and next(iter(self._revoked.values())) <= now:
+            self._revoked.popitem(last=False)
+        self._revoked[token] = token_exp if token_exp is not None else now + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+    def revoke_user(self, user_id: int) -> None:
+        # При смене статуса или роли: следующий запрос заново прочитает пользователя из БД
+        for token in list(self._by_user.get(user_id, ())):
+            self._drop(token)
+
+
+token_cache = TokenCache()
+
+
+def decode_access_token(token: str) -> dict:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        print(f"Payload: {payload}")
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
-        stmt = select(User.c.email).where(User.c.id == user_id)
-        result = await session.execute(stmt)
-        user = result.fetchone()
-        if user is None:
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
-        return user
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
-# Функция проверки заголовка Authorization
+
+async def resolve_principal(token: str) -> Principal:
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
+    if token_cache.is_revoked(token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+
+    payload = decode_access_token(token)
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    async with async_session_maker() as session:
+        stmt = select(User.c.id, User.c.email, User.c.status).where(User.c.id == int(user_id))
+        result = await session.execute(stmt)
+        user = result.fetchone()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+    if user.status == StatusEnum.INACTIVE:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User is inactive")
+
+    principal = Principal(id=user.id, email=user.email, status=user.status)
+    token_cache.put(token, principal, payload["exp"])
+    return principal
+
+
+def revoke_token(token: str) -> None:
+    try:
+        exp = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False}).get("exp")
+    except jwt.InvalidTokenError:
+        return
+    token_cache.revoke_token(token, exp)
+
+
+def revoke_user(user_id: int) -> None:
+    token_cache.revoke_user(user_id)
+
+
+async def set_user_status(session: AsyncSession, user_id: int, new_status: StatusEnum) -> None:
+    """Единственное место смены статуса: после коммита сбрасывает закэшированные токены пользователя."""
+    await session.execute(update(User).where(User.c.id == user_id).values(status=new_status))
+    await session.commit()
+    revoke_user(user_id)
+
+
+async def get_current_user(request: Request) -> Principal:
+    # Middleware уже проверил токен и положил пользователя в request.state
+    principal = getattr(request.state, "user", None)
+    if principal is not None:
+        return principal
+    token = await oauth2_scheme(request)
+    return await resolve_principal(token)
+
 async def validate_authorization_header(request: Request):
     # Извлекаем заголовок Authorization
     auth_header = request.headers.get("Authorization")
-    print("auth_header", auth_header) # None
     if not auth_header:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
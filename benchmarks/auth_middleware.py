@@ -0,0 +1,96 @@
+"""Запросов в секунду: @app.middleware("http") против AuthMiddleware (чистый ASGI).
+
+Базы не требует: токен заранее кладётся в кэш, приложение вызывается в процессе.
+
+    python benchmarks/auth_middleware.py --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import ROOT  # noqa: E402
+
+from fastapi import FastAPI, HTTPException, Request, status  # noqa: E402
+from fastapi.responses import JSONResponse, PlainTextResponse  # noqa: E402
+from fastapi.staticfiles import StaticFiles  # noqa: E402
+
+from auth import Principal, create_access_token, decode_access_token, resolve_principal, token_cache  # noqa: E402
+from middleware import AuthMiddleware  # noqa: E402
+from models import StatusEnum  # noqa: E402
+
+
+def build_app(kind):
+    app = FastAPI()
+    app.mount("/static", StaticFiles(directory=os.path.join(ROOT, "static")), name="static")
+
+    @app.get("/page")
+    async def page():
+        return PlainTextResponse("ok")
+
+    if kind == "asgi":
+        app.add_middleware(AuthMiddleware)
+    else:
+        # Прежняя реализация из main.py
+        @app.middleware("http")
+        async def auth_middleware(request: Request, call_next):
+            if request.url.path not in ["/login", "/register", "/logout"]:
+                token = request.cookies.get("Authorization")
+                if not token:
+                    return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content={"detail": "Not authenticated"})
+                try:
+                    request.state.user = await resolve_principal(token.replace("Bearer ", ""))
+                except HTTPException as e:
+                    return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+            return await call_next(request)
+    return app
+
+
+async def requests_per_second(app, path, cookies, count, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        for _ in range(50):
+            (await client.get(path)).raise_for_status()
+
+        remaining = count
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                (await client.get(path)).raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return count / (time.perf_counter() - start)
+
+
+async def run(args):
+    token = create_access_token({"sub": 1, "email": "bench@example.com"}, expires_delta=60)
+    token_cache.put(token, Principal(1, "bench@example.com", StatusEnum.ACTIVE), decode_access_token(token)["exp"])
+    cookies = {"Authorization": f"Bearer {token}"}
+
+    for path in ("/static/furnit_style.css", "/page"):
+        results = {}
+        for kind in ("http", "asgi"):
+            results[kind] = await requests_per_second(build_app(kind), path, cookies, args.requests, args.concurrency)
+        print(
+            f"{path:<26} http-middleware={results['http']:8.0f} req/s  "
+            f"asgi={results['asgi']:8.0f} req/s  ({results['asgi'] / results['http']:.2f}x)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Проверка планов запросов страниц категорий.
+
+Для каждой поддерживаемой комбинации фильтров и сортировки (первая страница,
+страница по курсору и COUNT) выполняет EXPLAIN и падает с кодом 1, если
+в плане есть Seq Scan по furniture или furniture_views. Запросы строятся теми же функциями,
+что и в приложении (listing.py). Нужна база с данными benchmarks/seed.py:
+на почти пустой таблице планировщик законно выбирает Seq Scan.
+
+    python benchmarks/check_plans.py
+    python benchmarks/check_plans.py --analyze --verbose
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from enum import Enum
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.dialects import postgresql  # noqa: E402
+
+from benchmarks.common import asyncpg_dsn  # noqa: E402
+from facets import FacetFilters  # noqa: E402
+from listing import SORTS, listing_count_statement, listing_statement  # noqa: E402
+from models import CategoryEnum, CountryEnum, MaterialEnum  # noqa: E402
+from pagination import NEXT, PREV  # noqa: E402
+
+# Комбинации фильтров, которые отдаёт форма на страницах категорий
+FILTER_SETS = {
+    "none": {},
+    "material": {"material": MaterialEnum.WOOD},
+    "manufacturer": {"manufacturer": CountryEnum.ITALY},
+    "price": {"min_price": 100.0, "max_price": 500.0},
+    "material+price": {"material": MaterialEnum.WOOD, "min_price": 100.0, "max_price": 500.0},
+    "manufacturer+price": {"manufacturer": CountryEnum.ITALY, "min_price": 100.0, "max_price": 500.0},
+    "material+manufacturer": {"material": MaterialEnum.WOOD, "manufacturer": CountryEnum.ITALY},
+}
+# Пример ключа курсора по имени первого столбца сортировки
+CURSOR_KEYS = {"id": [1_000], "price": [250.0, 1_000], "fullname": ["M", 1_000], "views": [10, 1_000]}
+
+
+def to_sql(stmt):
+    # Параметры $1, $2 для asyncpg, enum-ы именами членов — так их хранит Postgres
+    compiled = stmt.compile(dialect=postgresql.dialect(paramstyle="numeric_dollar"))
+    params = compiled.params
+    names = compiled.positiontup
+    values = [params[name].name if isinstance(params[name], Enum) else params[name] for name in names]
+    return str(compiled), values
+
+
+def seq_scans(plan: dict):
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in ("furniture", "furniture_views"):
+        yield plan
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def node_types(plan: dict):
+    yield plan["Node Type"] + (f" using {plan['Index Name']}" if "Index Name" in plan else "")
+    for child in plan.get("Plans", []):
+        yield from node_types(child)
+
+
+def cases():
+    for (filter_name, values), sort in itertools.product(FILTER_SETS.items(), SORTS):
+        filters = FacetFilters(CategoryEnum.TABLE, **values)
+        order, _ = SORTS[sort]
+        key = CURSOR_KEYS[order[0].name]
+        yield f"{filter_name} / {sort} / first page", listing_statement(filters, sort, None, NEXT)
+        yield f"{filter_name} / {sort} / next cursor", listing_statement(filters, sort, key, NEXT)
+        yield f"{filter_name} / {sort} / prev cursor", listing_statement(filters, sort, key, PREV)
+    for filter_name, values in FILTER_SETS.items():
+        if values:
+            yield f"{filter_name} / count", listing_count_statement(FacetFilters(CategoryEnum.TABLE, **values))
+
+
+async def check(args) -> int:
+    connection = await asyncpg.connect(asyncpg_dsn())
+    failures = 0
+    try:
+        if args.analyze:
+            await connection.execute("VACUUM ANALYZE furniture, furniture_views")
+        for name, stmt in cases():
+            sql, values = to_sql(stmt)
+            raw = await connection.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *values)
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            bad = list(seq_scans(plan))
+            failures += bool(bad)
+            if bad or args.verbose:
+                print(f"{'FAIL' if bad else 'ok  '} {name}: {' -> '.join(node_types(plan))}")
+    finally:
+        await connection.close()
+    print(f"\n{failures} of {sum(1 for _ in cases())} plans use a sequential scan")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analyze", action="store_true", help="VACUUM ANALYZE the listing tables first")
+    parser.add_argument("--verbose", action="store_true", help="print every plan, not only failures")
+    sys.exit(asyncio.run(check(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
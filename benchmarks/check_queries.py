@@ -0,0 +1,115 @@
+"""Проверка числа запросов к БД на маршрут по бюджетам querylog.QUERY_BUDGETS.
+
+Приложение вызывается в этом же процессе; перед каждым запросом кэши каталога
+сбрасываются, так что считается худший случай. Падает с кодом 1 и списком
+SQL, если маршрут сделал больше запросов, чем разрешено, — новый лишний
+round-trip ломает CI, а не продакшен. Нужна база с данными benchmarks/seed.py.
+
+    python benchmarks/check_queries.py
+    python benchmarks/check_queries.py --verbose
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import asyncpg_dsn, make_client  # noqa: E402
+from benchmarks.seed import BENCH_EMAIL, BENCH_PASSWORD  # noqa: E402
+from cache import catalog_version, invalidate_catalog  # noqa: E402
+from querylog import QUERY_BUDGETS, assert_max_queries  # noqa: E402
+
+
+async def load_ids() -> dict:
+    connection = await asyncpg.connect(asyncpg_dsn())
+    try:
+        rows = await connection.fetch("SELECT DISTINCT ON (category) category, id FROM furniture ORDER BY category, id")
+    finally:
+        await connection.close()
+    ids = {row["category"]: row["id"] for row in rows}
+    if len(ids) < 3:
+        raise SystemExit("No benchmark data: run benchmarks/seed.py first")
+    return ids
+
+
+async def user_uuid(email: str) -> str:
+    connection = await asyncpg.connect(asyncpg_dsn())
+    try:
+        return str(await connection.fetchval('SELECT user_uuid FROM "user" WHERE email = $1', email))
+    finally:
+        await connection.close()
+
+
+def cases(ids: dict, email: str):
+    # (метод, шаблон маршрута, функция client -> coroutine); регистрация раньше OTP — они используют её email
+    return [
+        ("GET", "/tables", lambda client: client.get("/tables")),
+        ("GET", "/tables/{table_id}", lambda client: client.get(f"/tables/{ids['TABLE']}")),
+        ("GET", "/chairs", lambda client: client.get("/chairs", params={"sort": "price_asc", "material": "wood"})),
+        ("GET", "/chairs/{chair_id}", lambda client: client.get(f"/chairs/{ids['CHAIR']}")),
+        ("GET", "/beds", lambda client: client.get("/beds", params={"sort": "popular"})),
+        ("GET", "/beds/{bed_id}", lambda client: client.get(f"/beds/{ids['BED']}")),
+        ("GET", "/search", lambda client: client.get("/search", params={"q": "modern", "format": "json"})),
+        ("GET", "/facets", lambda client: client.get("/facets", params={"category": "table"})),
+        ("GET", "/api/v1/furniture", lambda client: client.get("/api/v1/furniture", params={"category": "table"})),
+        ("GET", "/api/v1/furniture/{furniture_id}", lambda client: client.get(f"/api/v1/furniture/{ids['TABLE']}")),
+        ("POST", "/register", lambda client: client.post("/register", data={
+            "fullname": "Query Budget", "email": email, "password": BENCH_PASSWORD,
+        })),
+        ("POST", "/login", lambda client: client.post("/login", data={"username": BENCH_EMAIL.format(0), "password": BENCH_PASSWORD})),
+        ("POST", "/otp-create", lambda client: client.post("/otp-create", params={"email": email})),
+    ]
+
+
+async def run(verbose: bool) -> int:
+    ids = await load_ids()
+    email = f"budget-{uuid.uuid4().hex}@example.com"
+    failures = 0
+    async with make_client() as client:
+        login = await client.post("/login", data={"username": BENCH_EMAIL.format(0), "password": BENCH_PASSWORD})
+        if login.status_code != 303:
+            raise SystemExit(f"Login failed: {login.status_code} {login.text}")
+        # Прогрев кэша токенов, чтобы поиск пользователя не попадал в счёт маршрутов
+        await client.get("/main")
+
+        checks = cases(ids, email)
+        checks.append(("POST", "/otp-check", None))
+        for method, path, request in checks:
+            if request is None:
+                fields = {"user_uuid": await user_uuid(email), "email": email, "purpose": "user_register", "otp_code": "0000"}
+                request = lambda client: client.post("/otp-check", json=fields)  # noqa: E731
+            budget = QUERY_BUDGETS[(method, path)]
+            invalidate_catalog()
+            # Сверка общей версии каталога — до замера, иначе она попадёт в счёт маршрута
+            await catalog_version.refresh(force=True)
+            try:
+                with assert_max_queries(budget) as stats:
+                    response = await request(client)
+            except AssertionError as e:
+                failures += 1
+                print(f"FAIL {method} {path}: {e}")
+                continue
+            if response.status_code >= 500:
+                failures += 1
+                print(f"FAIL {method} {path}: status {response.status_code}")
+                continue
+            print(f"ok   {method} {path}: {stats.count}/{budget} queries, status {response.status_code}")
+            if verbose:
+                for statement in stats.statements:
+                    print(f"       {' '.join(statement.split())[:160]}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="print every statement")
+    failures = asyncio.run(run(parser.parse_args().verbose))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms: List[float], elapsed: float, errors: int = 0) -> Dict[str, float]:
+    return {
+        "requests": len(samples_ms),
+        "errors": errors,
+        "rps": round(len(samples_ms) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+    }
+
+
+def make_client(url: str = None, **kwargs) -> httpx.AsyncClient:
+    # Без url приложение вызывается в этом же процессе через ASGITransport
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=60, **kwargs)
+    from main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60, **kwargs)
+
+
+def asyncpg_dsn() -> str:
+    from database import DATABASE_URL
+    return DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
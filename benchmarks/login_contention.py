@@ -0,0 +1,98 @@
+"""Латентность страницы каталога под параллельными логинами.
+
+Пользователь должен существовать в базе (зарегистрируйте его через /register).
+
+    python benchmarks/login_contention.py --email user@example.com --password secret
+    python benchmarks/login_contention.py --url http://127.0.0.1:8000 --email ... --password ...
+
+Без --url приложение запускается в этом же процессе через httpx.ASGITransport,
+поэтому блокировка event loop хэшированием видна напрямую. Лимит частоты /login
+(RATE_LIMIT_LOGIN_*) в этом режиме снимается, иначе после первых логинов
+бенчмарк мерил бы ответы 429, а не bcrypt. Сервер для --url запускайте так же:
+
+    RATE_LIMIT_LOGIN_IP= RATE_LIMIT_LOGIN_ACCOUNT= uvicorn main:app
+
+Логины с ответом не 303 считаются отдельно; если они были, бенчмарк завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import make_client, percentile  # noqa: E402
+
+
+async def login(client, email, password):
+    response = await client.post("/login", data={"username": email, "password": password})
+    if response.status_code != 303:
+        raise SystemExit(f"Login failed: {response.status_code} {response.text}")
+    return response.cookies
+
+
+async def measure_listing(client, cookies, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get("/tables", cookies=cookies)
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return samples
+
+
+async def login_loop(client, email, password, stop, statuses: Counter):
+    while not stop.is_set():
+        response = await client.post("/login", data={"username": email, "password": password})
+        statuses[response.status_code] += 1
+
+
+async def run(args):
+    async with make_client(args.url) as client:
+        cookies = await login(client, args.email, args.password)
+        await measure_listing(client, cookies, 10)  # прогрев
+
+        results = {"idle": await measure_listing(client, cookies, args.requests)}
+
+        stop = asyncio.Event()
+        statuses = Counter()
+        loggers = [asyncio.create_task(login_loop(client, args.email, args.password, stop, statuses)) for _ in range(args.logins)]
+        try:
+            results["under_logins"] = await measure_listing(client, cookies, args.requests)
+        finally:
+            stop.set()
+            await asyncio.gather(*loggers, return_exceptions=True)
+
+    for name, samples in results.items():
+        print(
+            f"{name:>13}: p50={percentile(samples, 50):7.2f}ms "
+            f"p95={percentile(samples, 95):7.2f}ms p99={percentile(samples, 99):7.2f}ms"
+        )
+    print(f"{'logins':>13}: {statuses[303]} ok")
+    failed = {code: count for code, count in statuses.items() if code != 303}
+    if failed:
+        # 429 — сработал лимит частоты: замер показывает его, а не хэширование
+        print(f"{'failed logins':>13}: " + ", ".join(f"{code}={count}" for code, count in sorted(failed.items())))
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server; in-process if omitted")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--requests", type=int, default=200, help="listing requests per phase")
+    parser.add_argument("--logins", type=int, default=8, help="concurrent login loops")
+    args = parser.parse_args()
+    if not args.url:
+        # До импорта приложения: config читает лимиты при импорте
+        os.environ["RATE_LIMIT_LOGIN_IP"] = ""
+        os.environ["RATE_LIMIT_LOGIN_ACCOUNT"] = ""
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
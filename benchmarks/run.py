@@ -0,0 +1,210 @@
+"""Нагрузочный прогон по маршрутам с отчётом в JSON.
+
+Сначала засейте базу (benchmarks/seed.py), затем:
+
+    python benchmarks/run.py                          # приложение в этом процессе
+    python benchmarks/run.py --url http://127.0.0.1:8000
+    python benchmarks/run.py --routes listing_shallow,listing_deep_keyset --requests 2000
+    python benchmarks/run.py --compare benchmarks/results/<older>.json
+
+Для каждого маршрута считаются throughput и p50/p95/p99; результат пишется
+в benchmarks/results/<commit>-<время>.json, чтобы сравнивать коммиты.
+
+Все запросы идут с одного IP, поэтому для login/register/otp_check отключите
+лимиты: RATE_LIMIT_LOGIN_IP= RATE_LIMIT_REGISTER_IP= RATE_LIMIT_OTP_CHECK_IP= ...
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import ROOT, Timer, asyncpg_dsn, make_client, summarize  # noqa: E402
+from benchmarks.seed import BENCH_EMAIL, BENCH_PASSWORD  # noqa: E402
+from pagination import ITEMS_PER_PAGE, encode_cursor  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+class Fixtures:
+    """Данные из базы, нужные сценариям: id товаров, глубокий курсор, OTP."""
+
+    def __init__(self, table_ids, deep_cursor, deep_page, user_count):
+        self.table_ids = table_ids
+        self.deep_cursor = deep_cursor
+        self.deep_page = deep_page
+        self.user_count = user_count
+        self.otp_fields = []
+
+
+async def load_fixtures(depth: int) -> Fixtures:
+    connection = await asyncpg.connect(asyncpg_dsn())
+    try:
+        table_ids = [row["id"] for row in await connection.fetch(
+            "SELECT id FROM furniture WHERE category = 'TABLE' ORDER BY random() LIMIT 1000"
+        )]
+        deep_id = await connection.fetchval(
+            "SELECT id FROM furniture WHERE category = 'TABLE' ORDER BY id OFFSET $1 LIMIT 1", depth
+        )
+        user_count = await connection.fetchval('SELECT count(*) FROM "user" WHERE email LIKE \'bench%@example.com\'')
+    finally:
+        await connection.close()
+    if not table_ids or not user_count:
+        raise SystemExit("No benchmark data: run benchmarks/seed.py first")
+    deep_cursor = encode_cursor((deep_id,)) if deep_id is not None else None
+    return Fixtures(table_ids, deep_cursor, depth // ITEMS_PER_PAGE + 2, user_count)
+
+
+async def prepare_otp(client, count: int) -> list:
+    # Регистрируем пользователей заранее (вне замера) и достаём их коды из базы
+    emails = [f"otp-{uuid.uuid4().hex}@example.com" for _ in range(count)]
+    for email in emails:
+        await client.post("/register", data={"fullname": "OTP Bench", "email": email, "password": BENCH_PASSWORD})
+    connection = await asyncpg.connect(asyncpg_dsn())
+    try:
+        rows = await connection.fetch("""
+            SELECT DISTINCT ON (u.id) u.user_uuid, u.email, o.otp_code
+            FROM "user" u JOIN otp o ON o.user_id = u.id
+            WHERE u.email = ANY($1::text[])
+            ORDER BY u.id, o.id DESC
+        """, emails)
+    finally:
+        await connection.close()
+    return [
+        {"user_uuid": str(row["user_uuid"]), "email": row["email"], "purpose": "user_register", "otp_code": str(row["otp_code"])}
+        for row in rows
+    ]
+
+
+def scenarios(fixtures: Fixtures):
+    # name -> функция (client, i) -> coroutine ответа
+    return {
+        "listing_shallow": lambda client, i: client.get("/tables"),
+        "listing_deep_keyset": lambda client, i: client.get(
+            "/tables", params={"page": fixtures.deep_page, "cursor": fixtures.deep_cursor}
+        ),
+        "listing_deep_offset": lambda client, i: client.get("/tables", params={"page": fixtures.deep_page}),
+        "detail": lambda client, i: client.get(f"/tables/{random.choice(fixtures.table_ids)}"),
+        "api_listing": lambda client, i: client.get("/api/v1/furniture", params={"category": "table"}),
+        "api_detail": lambda client, i: client.get(f"/api/v1/furniture/{random.choice(fixtures.table_ids)}"),
+        "login": lambda client, i: client.post("/login", data={
+            "username": BENCH_EMAIL.format(i % fixtures.user_count), "password": BENCH_PASSWORD,
+        }),
+        "register": lambda client, i: client.post("/register", data={
+            "fullname": "Bench Register", "email": f"reg-{uuid.uuid4().hex}@example.com", "password": BENCH_PASSWORD,
+        }),
+        "otp_check": lambda client, i: client.post("/otp-check", json=fixtures.otp_fields[i % len(fixtures.otp_fields)]),
+    }
+
+
+async def run_scenario(client, request, count: int, concurrency: int) -> dict:
+    samples = []
+    errors = 0
+    statuses = {}
+    counter = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await request(client, i)
+            except Exception:
+                errors += 1
+                continue
+            samples.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                errors += 1
+
+    with Timer() as timer:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(samples, timer.elapsed, errors)
+    result["status_codes"] = {str(code): n for code, n in sorted(statuses.items())}
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_table(results: dict, baseline: dict = None) -> None:
+    print(f"{'route':<22}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in results.items():
+        line = f"{name:<22}{stats['rps']:>10.1f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+        old = (baseline or {}).get(name)
+        if old and old["p99_ms"]:
+            line += f"   p99 {100 * (stats['p99_ms'] - old['p99_ms']) / old['p99_ms']:+.1f}%  rps {100 * (stats['rps'] - old['rps']) / old['rps']:+.1f}%"
+        print(line)
+
+
+async def run(args) -> None:
+    fixtures = await load_fixtures(args.depth)
+    async with make_client(args.url) as client:
+        login = await client.post("/login", data={"username": BENCH_EMAIL.format(0), "password": BENCH_PASSWORD})
+        if login.status_code != 303:
+            raise SystemExit(f"Login failed: {login.status_code} {login.text}")
+
+        available = scenarios(fixtures)
+        selected = args.routes.split(",") if args.routes else list(available)
+        if "otp_check" in selected:
+            fixtures.otp_fields = await prepare_otp(client, min(args.requests, 200))
+
+        results = {}
+        for name in selected:
+            # Прогрев: соединения пула, компиляция шаблонов, кэши
+            await run_scenario(client, available[name], min(20, args.requests), 1)
+            results[name] = await run_scenario(client, available[name], args.requests, args.concurrency)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "target": args.url or "in-process",
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "deep_offset": args.depth,
+        },
+        "routes": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["routes"]
+    print_table(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['meta']['commit']}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nSaved {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running uvicorn; in-process if omitted")
+    parser.add_argument("--routes", help="comma-separated subset: listing_shallow, listing_deep_keyset, "
+                                         "listing_deep_offset, detail, api_listing, api_detail, "
+                                         "login, register, otp_check")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--depth", type=int, default=100_000, help="row offset used for the deep listing pages")
+    parser.add_argument("--output", help="result JSON path")
+    parser.add_argument("--compare", help="earlier result JSON to diff against")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Синтетический каталог и пользователи для бенчмарков.
+
+Строки генерируются детерминированно (--seed) и грузятся COPY пачками,
+так что миллионы строк не держатся в памяти целиком.
+
+    python benchmarks/seed.py --furniture 1000000 --users 10000
+    python benchmarks/seed.py --furniture 100000 --truncate
+
+Все пользователи получают пароль BENCH_PASSWORD и email bench{N}@example.com.
+COPY идёт мимо приложения, поэтому похожие товары затем считаются отдельно:
+python related.py rebuild.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime
+
+import asyncpg
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import asyncpg_dsn  # noqa: E402
+from models import CategoryEnum, CountryEnum, MaterialEnum, StatusEnum  # noqa: E402
+
+BENCH_PASSWORD = "benchmark-password"
+BENCH_EMAIL = "bench{}@example.com"
+
+ADJECTIVES = ["Classic", "Modern", "Rustic", "Compact", "Nordic", "Vintage", "Royal", "Urban", "Cozy", "Minimal"]
+WORDS = ["oak", "walnut", "steel", "ash", "pine", "glass", "linen", "velvet", "leather", "birch", "maple", "chrome"]
+
+FURNITURE_COLUMNS = ["fullname", "description", "price", "category", "material", "manufacturer", "image_url"]
+USER_COLUMNS = ["user_uuid", "fullname", "email", "registered_at", "hashed_password", "status"]
+
+
+def furniture_rows(count: int, rng: random.Random, run: str):
+    categories = list(CategoryEnum)
+    materials = list(MaterialEnum)
+    countries = list(CountryEnum)
+    for index in range(count):
+        category = categories[index % len(categories)]
+        material = rng.choice(materials)
+        words = " ".join(rng.sample(WORDS, 4))
+        yield (
+            f"{rng.choice(ADJECTIVES)} {material.value} {category.value} {run}-{index}",
+            f"A {words} {category.value} made of {material.value}.",
+            round(rng.lognormvariate(5.5, 0.8), 2),
+            category.name,
+            material.name,
+            rng.choice(countries).name,
+            f"/static/images/{category.value}-{index % 50}.jpg",
+        )
+
+
+def user_rows(count: int, hashed_password: str, offset: int):
+    now = datetime.utcnow()
+    for index in range(offset, offset + count):
+        yield (uuid.uuid4(), f"Bench User {index}", BENCH_EMAIL.format(index), now, hashed_password, StatusEnum.ACTIVE.name)
+
+
+async def copy_in_batches(connection, table: str, columns: list, rows, batch_size: int, total: int) -> None:
+    batch = []
+    done = 0
+    start = time.perf_counter()
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            await connection.copy_records_to_table(table, records=batch, columns=columns)
+            done += len(batch)
+            batch = []
+            print(f"\r{table}: {done}/{total} ({done / (time.perf_counter() - start):.0f} rows/s)", end="", flush=True)
+    if batch:
+        await connection.copy_records_to_table(table, records=batch, columns=columns)
+        done += len(batch)
+    print(f"\r{table}: {done}/{total} in {time.perf_counter() - start:.1f}s" + " " * 20)
+
+
+async def seed(args) -> None:
+    from auth import get_password_hash
+
+    connection = await asyncpg.connect(asyncpg_dsn())
+    try:
+        if args.truncate:
+            await connection.execute('TRUNCATE furniture, otp, "user" RESTART IDENTITY CASCADE')
+        rng = random.Random(args.seed)
+        run = uuid.uuid4().hex[:6]
+        await copy_in_batches(connection, "furniture", FURNITURE_COLUMNS, furniture_rows(args.furniture, rng, run), args.batch_size, args.furniture)
+
+        if args.users:
+            # Один bcrypt-хэш на всех: хэшировать миллион паролей ради сида незачем
+            hashed_password = get_password_hash(BENCH_PASSWORD)
+            offset = await connection.fetchval('SELECT count(*) FROM "user" WHERE email LIKE \'bench%@example.com\'')
+            await copy_in_batches(connection, "user", USER_COLUMNS, user_rows(args.users, hashed_password, offset), args.batch_size, args.users)
+        await connection.execute("ANALYZE furniture")
+        await connection.execute('ANALYZE "user"')
+    finally:
+        await connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--furniture", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--truncate", action="store_true", help="empty furniture, user and otp first")
+    asyncio.run(seed(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
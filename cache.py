@@ -0,0 +1,160 @@
+from collections import OrderedDict
+import logging
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import CATALOG_VERSION_CHECK_INTERVAL, CATEGORY_COUNT_TTL, FACET_CACHE_SIZE, PAGE_CACHE_SIZE, READ_YOUR_WRITES_SECONDS
+from database import AsyncSession, engine
+from models import CatalogState, CategoryEnum, Furniture
+from querylog import current_stats
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryCounter:
+    """Кэш количества товаров по категориям.
+
+    Считается одним GROUP BY запросом для всех категорий сразу и
+    сбрасывается при записи в каталог. TTL нужен для нескольких воркеров,
+    которые не видят инвалидацию друг друга.
+    """
+
+    def __init__(self, ttl: float = CATEGORY_COUNT_TTL):
+        self.ttl = ttl
+        self._counts: Dict[CategoryEnum, int] = {}
+        self._loaded_at: Optional[float] = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self, session: AsyncSession, category: CategoryEnum) -> int:
+        if not self._is_fresh():
+            stmt = select(Furniture.c.category, func.count()).group_by(Furniture.c.category)
+            result = await session.execute(stmt)
+            counts = {row[0]: row[1] for row in result.fetchall()}
+            if not may_cache(session):
+                return counts.get(category, 0)
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+        return self._counts.get(category, 0)
+
+    def invalidate(self, category: Optional[CategoryEnum] = None) -> None:
+        # Счётчики всех категорий грузятся одним запросом, поэтому сбрасываем целиком
+        self._counts = {}
+        self._loaded_at = None
+
+
+class LRUCache:
+    """Ограниченный по размеру LRU с необязательным TTL записей."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if self.ttl is not None and time.monotonic() - stored_at >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CatalogVersion:
+    """Версия каталога: (общая версия из catalog_state, счётчик записей этого процесса).
+
+    Страница, рендер которой начался до записи, сохраняется со старой
+    версией и при следующем чтении считается устаревшей. Свою запись процесс
+    видит сразу (bump), запись другого воркера — когда refresh перечитает
+    catalog_state, не чаще раза в interval: одна выборка по первичному ключу
+    на воркер вместо запроса на каждое попадание в кэш.
+    """
+
+    def __init__(self, interval: float = CATALOG_VERSION_CHECK_INTERVAL):
+        self.interval = interval
+        self.shared: Optional[int] = None
+        self.local = 0
+        self.bumped_at: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self._checking = False
+
+    @property
+    def value(self) -> Tuple[Optional[int], int]:
+        return self.shared, self.local
+
+    def bump(self) -> None:
+        self.local += 1
+        self.bumped_at = time.monotonic()
+
+    async def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if self._checking or (not force and self._checked_at is not None and now - self._checked_at < self.interval):
+            return
+        self._checking = True
+        # Сверка не относится к маршруту, на котором случилась: не считаем её в бюджет запросов
+        token = current_stats.set(None)
+        try:
+            async with engine.connect() as connection:
+                shared = await connection.scalar(select(CatalogState.c.version).where(CatalogState.c.id == 1))
+        except (OSError, SQLAlchemyError) as e:
+            # Без базы кэш живёт по TTL, как до появления общей версии
+            logger.warning("catalog version check failed: %r", e)
+        else:
+            if self.shared is not None and shared != self.shared:
+                # Каталог менялся (возможно, другим воркером): сбрасываем и остальные кэши
+                invalidate_catalog()
+            self.shared = shared
+        finally:
+            current_stats.reset(token)
+            self._checked_at = time.monotonic()
+            self._checking = False
+
+    def bumped_within(self, seconds: float) -> bool:
+        return self.bumped_at is not None and time.monotonic() - self.bumped_at < seconds
+
+
+category_counter = CategoryCounter()
+catalog_version = CatalogVersion()
+facet_cache = LRUCache(FACET_CACHE_SIZE, ttl=CATEGORY_COUNT_TTL)
+# Число товаров на отфильтрованных страницах категорий: FacetFilters -> count
+listing_count_cache = LRUCache(FACET_CACHE_SIZE, ttl=CATEGORY_COUNT_TTL)
+# Отрендеренные страницы каталога (PageCacheMiddleware): (путь, параметры) -> CachedPage
+page_cache = LRUCache(PAGE_CACHE_SIZE, ttl=CATEGORY_COUNT_TTL)
+
+
+def may_cache(session: AsyncSession) -> bool:
+    """Можно ли класть в кэши каталога результат чтения из session.
+
+    Реплика в первые READ_YOUR_WRITES_SECONDS после записи может её ещё не
+    видеть: только что сброшенный кэш снова заполнился бы старыми данными на
+    весь TTL. В это окно кэши заполняются только чтениями из основной базы.
+    """
+    return not session.info.get("replica") or not catalog_version.bumped_within(READ_YOUR_WRITES_SECONDS)
+
+
+def invalidate_catalog(category: Optional[CategoryEnum] = None) -> None:
+    """Вызывается после любой записи в furniture."""
+    category_counter.invalidate(category)
+    facet_cache.clear()
+    listing_count_cache.clear()
+    catalog_version.bump()
+    page_cache.clear()
@@ -0,0 +1,312 @@
+"""Массовая загрузка каталога из NDJSON или CSV.
+
+Строки читаются потоком, проверяются схемой InsertFurniture пачками по
+IMPORT_BATCH_SIZE, пачка загружается COPY во временную таблицу и одним
+INSERT ... ON CONFLICT (fullname) переносится в furniture. В памяти
+держится только текущая пачка, поэтому размер файла не ограничен.
+
+CLI:
+    python catalog_import.py items.ndjson
+    python catalog_import.py items.csv --format csv --on-conflict update
+"""
+import argparse
+import asyncio
+import csv
+import json
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+
+from cache import invalidate_catalog
+from config import IMPORT_BATCH_SIZE, IMPORT_CSV_MAX_RECORD_LINES, IMPORT_MAX_LINE_BYTES, IMPORT_MAX_REPORTED_ERRORS
+from database import AsyncSession, async_session_maker
+from related import related_index, related_worker
+from schemas import CatalogImportError, CatalogImportReport, InsertFurniture
+
+FORMATS = ("ndjson", "csv")
+CONFLICT_MODES = ("skip", "update")
+
+STAGING_COLUMNS = ["line_no", "fullname", "description", "price", "category", "material", "manufacturer", "image_url"]
+
+CREATE_STAGING = text("""
+    CREATE TEMP TABLE IF NOT EXISTS furniture_staging (
+        line_no integer NOT NULL,
+        fullname text NOT NULL,
+        description text NOT NULL,
+        price double precision NOT NULL,
+        category text NOT NULL,
+        material text NOT NULL,
+        manufacturer text NOT NULL,
+        image_url text NOT NULL
+    ) ON COMMIT DELETE ROWS
+""")
+
+# Enum-типы в БД хранят имена членов (TABLE, WOOD, ...), в staging лежит текст.
+# Из дублей внутри пачки берётся последняя строка, остальные попадают в отчёт.
+# Новые и обновлённые товары меняют списки похожих у себя и соседей по цене —
+# они отмечаются к пересчёту (related.py) в той же транзакции.
+MERGE_TEMPLATE = """
+    WITH picked AS (
+        SELECT DISTINCT ON (fullname) *
+        FROM furniture_staging
+        ORDER BY fullname, line_no DESC
+    ), merged AS (
+        INSERT INTO furniture (fullname, description, price, category, material, manufacturer, image_url)
+        SELECT fullname, description, price,
+               category::categoryenum, material::materialenum, manufacturer::countryenum, image_url
+        FROM picked
+        ORDER BY line_no
+        ON CONFLICT (fullname) {action}
+        RETURNING id, fullname
+    ), dirty AS (
+        INSERT INTO furniture_related_dirty (furniture_id, expand)
+        SELECT id, true FROM merged
+        ON CONFLICT (furniture_id) DO UPDATE SET expand = true
+    )
+    SELECT s.line_no, s.fullname,
+           m.fullname IS NULL AS conflicted,
+           s.line_no <> p.line_no AS duplicate
+    FROM furniture_staging s
+    JOIN picked p ON p.fullname = s.fullname
+    LEFT JOIN merged m ON m.fullname = s.fullname
+"""
+MERGE = {
+    "skip": text(MERGE_TEMPLATE.format(action="DO NOTHING")),
+    "update": text(MERGE_TEMPLATE.format(action="""DO UPDATE SET
+            description = EXCLUDED.description,
+            price = EXCLUDED.price,
+            category = EXCLUDED.category,
+            material = EXCLUDED.material,
+            manufacturer = EXCLUDED.manufacturer,
+            image_url = EXCLUDED.image_url""")),
+}
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_bytes: int = IMPORT_MAX_LINE_BYTES) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    # (номер строки, строка или None, если она длиннее max_bytes). Куски незаконченной
+    # строки копятся в списке, а в новом чанке ищутся только его переводы строк;
+    # хвост слишком длинной строки не хранится, а пропускается до следующего перевода
+    parts = []
+    size = 0
+    too_long = False
+    line_no = 0
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            if not too_long:
+                piece = chunk[start:] if end == -1 else chunk[start:end]
+                size += len(piece)
+                if size > max_bytes:
+                    too_long = True
+                    parts = []
+                else:
+                    parts.append(piece)
+            if end == -1:
+                break
+            line_no += 1
+            yield line_no, None if too_long else b"".join(parts)
+            parts = []
+            size = 0
+            too_long = False
+            start = end + 1
+    if size or too_long:
+        yield line_no + 1, None if too_long else b"".join(parts)
+
+
+class IncompleteRecord(Exception):
+    pass
+
+
+class LineFeed:
+    """Вход csv.reader, который пополняется по мере чтения потока.
+
+    Когда строки кончились посреди записи (перевод строки внутри кавычек),
+    поднимает IncompleteRecord: csv.reader начинает запись заново при
+    следующем вызове, поэтому её строки подаются ещё раз вместе со следующей.
+    """
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise IncompleteRecord
+        return self.lines.popleft()
+
+
+async def iter_csv_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    # Запись может занимать несколько строк файла; номер в отчёте — её первая строка
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    header = None
+    pending = []
+    first_line_no = 0
+    async for line_no, raw in iter_lines(chunks):
+        if raw is None:
+            yield line_no, None, f"Line longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            pending = []
+            continue
+        try:
+            line = raw.decode("utf-8").rstrip("\r")
+        except UnicodeDecodeError as e:
+            yield line_no, None, f"Invalid UTF-8: {e}"
+            pending = []
+            continue
+        if not pending:
+            if not line.strip():
+                continue
+            first_line_no = line_no
+            pending_bytes = 0
+        pending.append(line + "\n")
+        pending_bytes += len(raw)
+        if pending_bytes > IMPORT_MAX_LINE_BYTES:
+            yield first_line_no, None, f"Record longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            pending = []
+            continue
+        feed.lines.extend(pending)
+        try:
+            values = next(reader)
+        except IncompleteRecord:
+            if len(pending) >= IMPORT_CSV_MAX_RECORD_LINES:
+                yield first_line_no, None, f"Unterminated quoted field (more than {IMPORT_CSV_MAX_RECORD_LINES} lines)"
+                pending = []
+            continue
+        except csv.Error as e:
+            yield first_line_no, None, f"Invalid CSV: {e}"
+            feed.lines.clear()
+            pending = []
+            continue
+        pending = []
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield first_line_no, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield first_line_no, dict(zip(header, values)), None
+    if pending:
+        yield first_line_no, None, "Unterminated quoted field at end of file"
+
+
+async def iter_records(chunks: AsyncIterable[bytes], fmt: str) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    # (номер строки, запись или None, ошибка разбора или None); в CSV первая запись — заголовок
+    if fmt == "csv":
+        async for item in iter_csv_records(chunks):
+            yield item
+        return
+    async for line_no, raw in iter_lines(chunks):
+        if raw is None:
+            yield line_no, None, f"Line longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            continue
+        try:
+            line = raw.decode("utf-8").strip()
+        except UnicodeDecodeError as e:
+            yield line_no, None, f"Invalid UTF-8: {e}"
+            continue
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Expected a JSON object"
+            continue
+        yield line_no, record, None
+
+
+class CatalogImporter:
+    def __init__(self, session: AsyncSession, on_conflict: str = "skip", batch_size: int = IMPORT_BATCH_SIZE):
+        self.session = session
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.report = CatalogImportReport()
+
+    def add_error(self, line: int, error: str) -> None:
+        self.report.failed += 1
+        if len(self.report.errors) < IMPORT_MAX_REPORTED_ERRORS:
+            self.report.errors.append(CatalogImportError(line=line, error=error))
+        else:
+            self.report.errors_truncated = True
+
+    async def run(self, chunks: AsyncIterable[bytes], fmt: str) -> CatalogImportReport:
+        batch = []
+        try:
+            async for line_no, record, error in iter_records(chunks, fmt):
+                self.report.received += 1
+                if error is not None:
+                    self.add_error(line_no, error)
+                    continue
+                try:
+                    item = InsertFurniture.model_validate(record)
+                except ValidationError as e:
+                    self.add_error(line_no, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                    continue
+                batch.append((
+                    line_no, item.fullname, item.description, item.price,
+                    item.category.name, item.material.name, item.manufacturer.name, item.image_url,
+                ))
+                if len(batch) >= self.batch_size:
+                    await self.load_batch(batch)
+                    batch = []
+            if batch:
+                await self.load_batch(batch)
+        finally:
+            if self.report.loaded:
+                invalidate_catalog()
+                related_worker.wake()
+        return self.report
+
+    async def load_batch(self, batch: list) -> None:
+        await self.session.execute(CREATE_STAGING)
+        connection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            "furniture_staging", records=batch, columns=STAGING_COLUMNS
+        )
+        result = await self.session.execute(MERGE[self.on_conflict])
+        rows = result.fetchall()
+        await self.session.commit()
+
+        for row in rows:
+            if row.duplicate:
+                self.add_error(row.line_no, f"Duplicate fullname '{row.fullname}' later in the file")
+            elif row.conflicted:
+                self.add_error(row.line_no, f"Item '{row.fullname}' already exists")
+            else:
+                self.report.loaded += 1
+
+
+async def import_catalog(session: AsyncSession, chunks: AsyncIterable[bytes], fmt: str = "ndjson", on_conflict: str = "skip") -> CatalogImportReport:
+    return await CatalogImporter(session, on_conflict).run(chunks, fmt)
+
+
+async def read_file(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, chunk_size):
+            yield chunk
+
+
+async def main(path: str, fmt: str, on_conflict: str) -> None:
+    async with async_session_maker() as session:
+        report = await import_catalog(session, read_file(path), fmt, on_conflict)
+    # Фоновой задачи приложения здесь нет: похожие товары пересчитываем сразу
+    await related_index.flush()
+    print(report.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import furniture from NDJSON or CSV")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="default: by file extension")
+    parser.add_argument("--on-conflict", choices=CONFLICT_MODES, default="skip")
+    args = parser.parse_args()
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    asyncio.run(main(args.path, fmt, args.on_conflict))
@@ -8,4 +8,142 @@ DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
 DB_NAME = os.environ.get("DB_NAME")
 DB_USER = os.environ.get("DB_USER")
-DB_PASS = os.environ.get("DB_PASS")
\ No newline at end of file
+DB_PASS = os.environ.get("DB_PASS")
+
+CATEGORY_COUNT_TTL = float(os.environ.get("CATEGORY_COUNT_TTL", 60))
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get("PASSWORD_HASH_QUEUE_LIMIT", 64))
+
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 300))
+
+# Через запятую; пути из AUTH_PUBLIC_PREFIXES пропускаются вместе со всем, что под ними
+AUTH_PUBLIC_PATHS = os.environ.get("AUTH_PUBLIC_PATHS", "/login,/register,/logout,/metrics,/health/pool,/ready").split(",")
+AUTH_PUBLIC_PREFIXES = os.environ.get("AUTH_PUBLIC_PREFIXES", "/static,/images").split(",")
+
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_REPORTED_ERRORS = int(os.environ.get("IMPORT_MAX_REPORTED_ERRORS", 1000))
+# Максимальная длина строки файла (и записи CSV) в байтах: длиннее — ошибка в отчёте, строка пропускается
+IMPORT_MAX_LINE_BYTES = int(os.environ.get("IMPORT_MAX_LINE_BYTES", 1 << 20))
+# Сколько строк файла может занять одна запись CSV (переводы строк в кавычках), прежде чем она считается битой
+IMPORT_CSV_MAX_RECORD_LINES = int(os.environ.get("IMPORT_CSV_MAX_RECORD_LINES", 100))
+
+OTP_EXPIRE_MINUTES = int(os.environ.get("OTP_EXPIRE_MINUTES", 1))
+
+# Границы ценовых корзин для фасетов: <100, 100-250, ..., 1000+
+FACET_PRICE_BUCKETS = [float(edge) for edge in os.environ.get("FACET_PRICE_BUCKETS", "100,250,500,1000").split(",")]
+FACET_CACHE_SIZE = int(os.environ.get("FACET_CACHE_SIZE", 256))
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# default — обычный Postgres; pgbouncer — transaction pooling, без кэша подготовленных запросов
+DB_PROFILE = os.environ.get("DB_PROFILE", "default")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+DB_POOL_WAIT_WARN_SECONDS = float(os.environ.get("DB_POOL_WAIT_WARN_SECONDS", 0.1))
+
+# Реплика для чтения каталога; пусто — все запросы идут в основную базу
+DB_REPLICA_HOST = os.environ.get("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.environ.get("DB_REPLICA_PORT", DB_PORT)
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_HEALTH_INTERVAL = float(os.environ.get("REPLICA_HEALTH_INTERVAL", 5))
+# Проверка реплики (и первое соединение сессии) не дольше этого, иначе чтение идёт в основную базу
+REPLICA_PROBE_TIMEOUT = float(os.environ.get("REPLICA_PROBE_TIMEOUT", 1))
+# Сколько секунд после записи клиент читает из основной базы
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+
+THUMBNAIL_WIDTHS = [int(width) for width in os.environ.get("THUMBNAIL_WIDTHS", "160,320,640").split(",")]
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", ".cache/images")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+IMAGE_SOURCE_MAX_BYTES = int(os.environ.get("IMAGE_SOURCE_MAX_BYTES", 20 * 1024 * 1024))
+# Хосты, с которых можно брать исходники картинок по http(s), через запятую; пусто — только /static/
+IMAGE_ALLOWED_HOSTS = frozenset(host.strip().lower() for host in os.environ.get("IMAGE_ALLOWED_HOSTS", "").split(",") if host.strip())
+
+# JSON API: размер страницы по умолчанию/максимальный и строк в одной пачке выгрузки
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 50))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 200))
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
+
+# Фоновая очистка просроченных OTP: период, размер пачки DELETE и сколько хранить после истечения
+OTP_PURGE_INTERVAL = float(os.environ.get("OTP_PURGE_INTERVAL", 60))
+OTP_PURGE_BATCH_SIZE = int(os.environ.get("OTP_PURGE_BATCH_SIZE", 1000))
+OTP_RETENTION_MINUTES = int(os.environ.get("OTP_RETENTION_MINUTES", 60))
+
+# Ограничение частоты на дорогих маршрутах авторизации, формат "<запросов>/<секунд>", пусто — без лимита.
+# Для каждого маршрута два ведра: по IP клиента и по аккаунту (email)
+RATE_LIMITS = {
+    route: (
+        os.environ.get(f"RATE_LIMIT_{route.upper()}_IP", ip_default),
+        os.environ.get(f"RATE_LIMIT_{route.upper()}_ACCOUNT", account_default),
+    )
+    for route, ip_default, account_default in (
+        ("login", "30/60", "5/60"),
+        ("register", "10/60", "3/60"),
+        ("otp_check", "30/60", "5/60"),
+    )
+}
+# memory:// — ведра в памяти воркера; redis://host:6379/0 — общие для всех воркеров (нужен пакет redis)
+RATE_LIMIT_STORAGE_URL = os.environ.get("RATE_LIMIT_STORAGE_URL", "memory://")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100_000))
+
+# Прогрев воркера при старте: сколько соединений пула открыть заранее и сколько ждать базу
+DB_WARMUP_CONNECTIONS = int(os.environ.get("DB_WARMUP_CONNECTIONS", DB_POOL_SIZE))
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", 10))
+WARMUP_RETRY_INTERVAL = float(os.environ.get("WARMUP_RETRY_INTERVAL", 5))
+# При остановке по SIGTERM: сколько ещё обслуживать трафик с /ready = 503 (дольше интервала
+# проверки балансировщика), затем сколько ждать завершения запросов в работе
+SHUTDOWN_GRACE_PERIOD = float(os.environ.get("SHUTDOWN_GRACE_PERIOD", 5))
+SHUTDOWN_DRAIN_TIMEOUT = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT", 25))
+
+# Счётчик просмотров: как часто сбрасывать накопленное в furniture_views и сколько id в одном INSERT
+VIEW_FLUSH_INTERVAL = float(os.environ.get("VIEW_FLUSH_INTERVAL", 10))
+VIEW_FLUSH_BATCH_SIZE = int(os.environ.get("VIEW_FLUSH_BATCH_SIZE", 1000))
+
+# Кэш отрендеренных страниц каталога: число страниц и максимальный размер одной страницы
+PAGE_CACHE_SIZE = int(os.environ.get("PAGE_CACHE_SIZE", 1024))
+PAGE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("PAGE_CACHE_MAX_ENTRY_BYTES", 256 * 1024))
+# Как часто воркер сверяет общую версию каталога (catalog_state): запись из другого
+# воркера видна в его кэшах не позже чем через столько секунд; 0 — на каждый запрос страницы
+CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get("CATALOG_VERSION_CHECK_INTERVAL", 1))
+
+# Скомпилированные шаблоны Jinja2 на диске (общие для воркеров) и размер куска при потоковом рендере
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", ".cache/jinja")
+TEMPLATE_STREAM_CHUNK_BYTES = int(os.environ.get("TEMPLATE_STREAM_CHUNK_BYTES", 16 * 1024))
+
+# Доставка писем из outbox: smtp (по умолчанию локальная заглушка на 1025) или postmark
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "smtp")
+EMAIL_FROM = os.environ.get("EMAIL_FROM", "FurnitX <no-reply@furnitx.local>")
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 1025))
+SMTP_USER = os.environ.get("SMTP_USER")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "false").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", 10))
+POSTMARK_SERVER_TOKEN = os.environ.get("POSTMARK_SERVER_TOKEN")
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", 5))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 8))
+# Задержка перед повтором: base * 2^(попытка-1), не больше max, плюс случайный разброс
+OUTBOX_BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_BASE", 10))
+OUTBOX_BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", 3600))
+# Сколько секунд взятая пачка считается занятой; пока идёт отправка, аренда продлевается каждую
+# треть срока, а после падения воркера строки вернутся в очередь
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", 120))
+
+# Отладка запросов к БД (querylog.py): заголовки X-DB-Queries/Server-Timing и порог для EXPLAIN медленных запросов
+DB_QUERY_DEBUG_HEADER = os.environ.get("DB_QUERY_DEBUG_HEADER", "false").lower() in ("1", "true", "yes")
+DB_EXPLAIN_THRESHOLD = float(os.environ["DB_EXPLAIN_THRESHOLD"]) if os.environ.get("DB_EXPLAIN_THRESHOLD") else None
+
+# Похожие товары (related.py): сколько показывать, сколько соседей по цене с каждой стороны
+# рассматривать, как часто пересчитывать изменённые товары и размер пачки пересчёта
+RELATED_ITEMS_COUNT = int(os.environ.get("RELATED_ITEMS_COUNT", 4))
+RELATED_CANDIDATES = int(os.environ.get("RELATED_CANDIDATES", 50))
+RELATED_REBUILD_INTERVAL = float(os.environ.get("RELATED_REBUILD_INTERVAL", 5))
+RELATED_REBUILD_BATCH_SIZE = int(os.environ.get("RELATED_REBUILD_BATCH_SIZE", 200))
@@ -1,15 +1,196 @@
-from typing import AsyncGenerator
-from fastapi import Depends
+import asyncio
+import logging
+import time
+from typing import AsyncGenerator, Optional
+from uuid import uuid4
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from config import DB_HOST, DB_NAME, DB_PASS, DB_PORT, DB_USER
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from config import (
+    DB_HOST, DB_MAX_OVERFLOW, DB_NAME, DB_PASS, DB_POOL_PRE_PING, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_WAIT_WARN_SECONDS, DB_PORT, DB_PROFILE, DB_REPLICA_HOST, DB_REPLICA_PORT, DB_STATEMENT_CACHE_SIZE, DB_USER,
+    READ_YOUR_WRITES_SECONDS, REPLICA_HEALTH_INTERVAL, REPLICA_MAX_LAG_SECONDS, REPLICA_PROBE_TIMEOUT,
+)
+from metrics import db_pool_connections, db_pool_wait_seconds, db_read_routing_total, register_collector
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+REPLICA_DATABASE_URL = (
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}" if DB_REPLICA_HOST else None
+)
+
+READ_YOUR_WRITES_COOKIE = "primary_reads_until"
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул, который замеряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            db_pool_wait_seconds.observe(waited)
+            if waited >= DB_POOL_WAIT_WARN_SECONDS:
+                logger.warning("db pool wait=%.3fs %s", waited, self.status())
+
+
+def engine_options(profile: str = DB_PROFILE) -> dict:
+    options = {
+        "poolclass": InstrumentedPool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    }
+    if profile == "pgbouncer":
+        # В transaction mode соседние транзакции попадают на разные серверные соединения:
+        # именованные подготовленные запросы там ломаются, поэтому кэши выключены, а имена уникальны
+        options["pool_pre_ping"] = True
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    elif profile != "default":
+        raise ValueError(f"Unknown DB_PROFILE: {profile}")
+    return options
 
 
-engine = create_async_engine(DATABASE_URL)
+engine = create_async_engine(DATABASE_URL, **engine_options())
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+replica_engine = create_async_engine(REPLICA_DATABASE_URL, **engine_options()) if REPLICA_DATABASE_URL else None
+# info["replica"] видят кэши каталога (cache.may_cache)
+replica_session_maker = async_sessionmaker(replica_engine, expire_on_commit=False, info={"replica": True}) if replica_engine else None
+
+
+class ReplicaHealth:
+    """Кэшированная проверка отставания реплики, не чаще раза в REPLICA_HEALTH_INTERVAL."""
+
+    # Если реплика догнала всё полученное WAL, отставания нет, даже когда на основной базе давно не было записей
+    LAG_QUERY = text("""
+        SELECT CASE
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+
+    def __init__(self, engine, max_lag: float = REPLICA_MAX_LAG_SECONDS, interval: float = REPLICA_HEALTH_INTERVAL,
+                 timeout: float = REPLICA_PROBE_TIMEOUT):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.interval = interval
+        self.timeout = timeout
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        self._checking = False
+
+    async def is_usable(self) -> bool:
+        now = time.monotonic()
+        if self._checking or (self._checked_at is not None and now - self._checked_at < self.interval):
+            return self.healthy
+        self._checking = True
+        try:
+            # Недоступный хост не должен держать запрос, который попал на проверку, дольше timeout;
+            # TimeoutError — подкласс OSError
+            self.lag = await asyncio.wait_for(self.probe(), self.timeout)
+            self.healthy = self.lag <= self.max_lag
+            if not self.healthy:
+                logger.warning("replica lag=%.1fs exceeds %.1fs, reading from primary", self.lag, self.max_lag)
+        except (OSError, SQLAlchemyError) as e:
+            self.healthy = False
+            logger.warning("replica health check failed: %r", e)
+        finally:
+            self._checked_at = time.monotonic()
+            self._checking = False
+        return self.healthy
+
+    async def probe(self) -> float:
+        async with self.engine.connect() as connection:
+            return float(await connection.scalar(self.LAG_QUERY))
+
+    def mark_unhealthy(self) -> None:
+        self.healthy = False
+        self._checked_at = time.monotonic()
+
+
+replica_health = ReplicaHealth(replica_engine) if replica_engine else None
+
+
+def pool_status(pool=None) -> dict:
+    pool = pool or engine.pool
+    status = {
+        "profile": DB_PROFILE,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "wait_seconds_total": db_pool_wait_seconds.total(),
+        "waits": db_pool_wait_seconds.count(),
+    }
+    if replica_engine is not None and pool is engine.pool:
+        replica_pool = replica_engine.pool
+        status["replica"] = {
+            "healthy": replica_health.healthy,
+            "lag_seconds": replica_health.lag,
+            "size": replica_pool.size(),
+            "checked_out": replica_pool.checkedout(),
+            "checked_in": replica_pool.checkedin(),
+            "overflow": replica_pool.overflow(),
+        }
+    return status
+
+
+def collect_pool_metrics() -> None:
+    status = pool_status()
+    for state in ("checked_out", "checked_in", "overflow"):
+        db_pool_connections.set(state, value=status[state])
+
+
+register_collector(collect_pool_metrics)
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def reads_from_primary(request: Request) -> bool:
+    # Клиент недавно что-то записал: читаем из основной базы, чтобы он увидел свою запись
+    try:
+        return float(request.cookies.get(READ_YOUR_WRITES_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Сессия только для чтения: реплика, если она жива и не отстаёт, иначе основная база."""
+    session = None
+    if replica_session_maker is not None and not reads_from_primary(request) and await replica_health.is_usable():
+        session = replica_session_maker()
+        try:
+            await asyncio.wait_for(session.connection(), REPLICA_PROBE_TIMEOUT)
+        except (OSError, SQLAlchemyError) as e:
+            logger.warning("replica unavailable, falling back to primary: %s", e)
+            replica_health.mark_unhealthy()
+            await session.close()
+            session = None
+    db_read_routing_total.inc("primary" if session is None else "replica")
+    # PageCacheMiddleware по этому флагу решает, можно ли кэшировать страницу (как cache.may_cache)
+    request.state.replica_read = session is not None
+    if session is None:
+        session = async_session_maker()
+    async with session:
+        yield session
@@ -0,0 +1,87 @@
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import case, func, literal_column, select
+
+from cache import facet_cache, may_cache
+from config import FACET_PRICE_BUCKETS
+from database import AsyncSession
+from models import CategoryEnum, CountryEnum, Furniture, MaterialEnum
+from schemas import FacetCount, FacetsResponse
+
+
+class FacetFilters(NamedTuple):
+    category: Optional[CategoryEnum] = None
+    material: Optional[MaterialEnum] = None
+    manufacturer: Optional[CountryEnum] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def where(self) -> list:
+        criteria = []
+        if self.category is not None:
+            criteria.append(Furniture.c.category == self.category)
+        if self.material is not None:
+            criteria.append(Furniture.c.material == self.material)
+        if self.manufacturer is not None:
+            criteria.append(Furniture.c.manufacturer == self.manufacturer)
+        if self.min_price is not None:
+            criteria.append(Furniture.c.price >= self.min_price)
+        if self.max_price is not None:
+            criteria.append(Furniture.c.price <= self.max_price)
+        return criteria
+
+
+def price_bucket_labels(edges: List[float] = FACET_PRICE_BUCKETS) -> List[str]:
+    bounds = [0.0] + edges
+    labels = [f"{low:g}-{high:g}" for low, high in zip(bounds, edges)]
+    return labels + [f"{edges[-1]:g}+"]
+
+
+PRICE_BUCKET_LABELS = price_bucket_labels()
+# Границы подставляются литералами, чтобы выражение в SELECT и в GROUP BY совпадало текстуально
+price_bucket = case(
+    *((Furniture.c.price < literal_column(repr(edge)), literal_column(str(index))) for index, edge in enumerate(FACET_PRICE_BUCKETS)),
+    else_=literal_column(str(len(FACET_PRICE_BUCKETS))),
+).label("price_bucket")
+
+
+async def compute_facets(session: AsyncSession, filters: FacetFilters) -> FacetsResponse:
+    # Все измерения одним агрегатом: GROUPING SETS вместо отдельного COUNT(*) на каждое
+    cached = facet_cache.get(filters)
+    if cached is not None:
+        return cached
+
+    stmt = (
+        select(
+            Furniture.c.category,
+            Furniture.c.material,
+            Furniture.c.manufacturer,
+            price_bucket,
+            func.grouping(Furniture.c.category).label("g_category"),
+            func.grouping(Furniture.c.material).label("g_material"),
+            func.grouping(Furniture.c.manufacturer).label("g_manufacturer"),
+            func.count().label("count"),
+        )
+        .where(*filters.where())
+        .group_by(func.grouping_sets(Furniture.c.category, Furniture.c.material, Furniture.c.manufacturer, price_bucket))
+    )
+    result = await session.execute(stmt)
+
+    facets = {"category": [], "material": [], "manufacturer": [], "price": []}
+    for row in result.fetchall():
+        if row.g_category == 0:
+            facets["category"].append(FacetCount(value=row.category.value, count=row.count))
+        elif row.g_material == 0:
+            facets["material"].append(FacetCount(value=row.material.value, count=row.count))
+        elif row.g_manufacturer == 0:
+            facets["manufacturer"].append(FacetCount(value=row.manufacturer.value, count=row.count))
+        else:
+            facets["price"].append(FacetCount(value=PRICE_BUCKET_LABELS[row.price_bucket], count=row.count))
+    for name in ("category", "material", "manufacturer"):
+        facets[name].sort(key=lambda facet: -facet.count)
+    facets["price"].sort(key=lambda facet: PRICE_BUCKET_LABELS.index(facet.value))
+
+    response = FacetsResponse(**facets)
+    if may_cache(session):
+        facet_cache.set(filters, response)
+    return response
@@ -0,0 +1,238 @@
+"""Уменьшенные копии картинок товаров для карточек в списках.
+
+Производные (WebP/JPEG фиксированных ширин) считаются в пуле процессов и
+лежат в IMAGE_CACHE_DIR, размер которого ограничен IMAGE_CACHE_MAX_BYTES
+с вытеснением давно не запрошенных файлов.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import IMAGE_ALLOWED_HOSTS, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES, IMAGE_SOURCE_MAX_BYTES, IMAGE_WORKERS, THUMBNAIL_WIDTHS
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+CARD_SIZES = "(max-width: 600px) 100vw, 320px"
+
+
+def render_derivative(source: bytes, width: int, fmt: str) -> bytes:
+    # Выполняется в отдельном процессе, поэтому Pillow импортируется здесь
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(source)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        if fmt == "webp":
+            image.save(output, "WEBP", quality=80, method=4)
+        else:
+            image.save(output, "JPEG", quality=82, optimize=True, progressive=True)
+        return output.getvalue()
+
+
+def image_version(image_url: str) -> str:
+    return hashlib.sha1(image_url.encode()).hexdigest()[:10]
+
+
+def _field(item, name: str):
+    # В шаблоны приходят и словари (списки категорий), и pydantic-модели (поиск)
+    return item[name] if isinstance(item, dict) else getattr(item, name)
+
+
+def has_thumbnails(item) -> bool:
+    # Миниатюры строятся только из /static/ и хостов IMAGE_ALLOWED_HOSTS; остальные
+    # картинки шаблоны показывают по исходному image_url
+    return derivable(_field(item, "image_url"))
+
+
+def thumbnail_url(item, width: int, fmt: str = "jpeg") -> str:
+    # v меняется вместе с image_url, поэтому кэш браузера и диска не отдаст старую картинку
+    return f"/images/{_field(item, 'id')}/{width}.{fmt}?v={image_version(_field(item, 'image_url'))}"
+
+
+def thumbnail_srcset(item, fmt: str = "jpeg") -> str:
+    return ", ".join(f"{thumbnail_url(item, width, fmt)} {width}w" for width in THUMBNAIL_WIDTHS)
+
+
+class DerivativeCache:
+    """Файлы на диске + LRU-порядок в памяти; при превышении лимита удаляются самые старые.
+
+    Файл, отданный меньше EVICTION_GRACE секунд назад, может ещё читаться
+    FileResponse, поэтому не удаляется, даже если кэш временно больше лимита.
+    """
+
+    EVICTION_GRACE = 60.0
+
+    def __init__(self, directory: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # ключ -> (размер, время последнего обращения по time.monotonic)
+        self._files: Optional[OrderedDict[str, Tuple[int, float]]] = None
+        self._total = 0
+
+    def _load(self) -> OrderedDict:
+        if self._files is None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for name in os.listdir(self.directory):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+            # Файлы с прошлого запуска никто не отдаёт — для них время обращения "давно"
+            self._files = OrderedDict((name, (size, float("-inf"))) for _, name, size in sorted(entries))
+            self._total = sum(size for size, _ in self._files.values())
+        return self._files
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        files = self._load()
+        entry = files.get(key)
+        if entry is None:
+            return None
+        path = self.path(key)
+        if not os.path.exists(path):
+            # Удалён снаружи (или другим воркером с тем же каталогом) — считаем промахом и перегенерируем
+            del files[key]
+            self._total -= entry[0]
+            return None
+        files[key] = (entry[0], time.monotonic())
+        files.move_to_end(key)
+        return path
+
+    def write(self, key: str, content: bytes) -> str:
+        # Только запись файла — можно вызывать из потока; учёт размера делает record()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(content)
+        os.replace(temporary, path)
+        return path
+
+    def record(self, key: str, size: int) -> None:
+        files = self._load()
+        now = time.monotonic()
+        previous = files.pop(key, None)
+        self._total += size - (previous[0] if previous else 0)
+        files[key] = (size, now)
+        if self._total <= self.max_bytes:
+            return
+        for oldest in list(files):
+            if self._total <= self.max_bytes:
+                break
+            old_size, used_at = files[oldest]
+            if now - used_at < self.EVICTION_GRACE:
+                # Дальше по LRU только более свежие файлы
+                break
+            del files[oldest]
+            self._total -= old_size
+            try:
+                os.remove(self.path(oldest))
+            except FileNotFoundError:
+                pass
+
+
+class ThumbnailService:
+    def __init__(self, cache: DerivativeCache, workers: int = IMAGE_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @staticmethod
+    def key(furniture_id: int, image_url: str, width: int, fmt: str) -> str:
+        return f"{furniture_id}-{image_version(image_url)}-{width}.{fmt}"
+
+    def cached(self, furniture_id: int, version: str, width: int, fmt: str) -> Optional[str]:
+        return self.cache.get(f"{furniture_id}-{version}-{width}.{fmt}")
+
+    async def derivative(self, furniture_id: int, image_url: str, width: int, fmt: str) -> str:
+        key = self.key(furniture_id, image_url, width, fmt)
+        path = self.cache.get(key)
+        if path is not None:
+            return path
+        # Одинаковые запросы во время генерации ждут один и тот же результат
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._generate(key, image_url, width, fmt))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _generate(self, key: str, image_url: str, width: int, fmt: str) -> str:
+        source = await fetch_source(image_url)
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(self.executor, render_derivative, source, width, fmt)
+        path = await asyncio.to_thread(self.cache.write, key, content)
+        self.cache.record(key, len(content))
+        return path
+
+
+def allowed_remote(image_url: str) -> bool:
+    parsed = urlsplit(image_url)
+    return parsed.scheme in ("http", "https") and (parsed.hostname or "").lower() in IMAGE_ALLOWED_HOSTS
+
+
+def derivable(image_url: str) -> bool:
+    return image_url.startswith("/static/") or allowed_remote(image_url)
+
+
+async def fetch_source(image_url: str) -> bytes:
+    if image_url.startswith("/static/"):
+        path = os.path.normpath(image_url.lstrip("/"))
+        if not path.startswith("static" + os.sep):
+            raise ValueError("Image path outside of static directory")
+        return await asyncio.to_thread(_read_file, path)
+    # image_url задают пользователи, а /images публичный: внешние адреса только из списка
+    # IMAGE_ALLOWED_HOSTS и без редиректов, иначе это запросы сервера во внутреннюю сеть
+    if allowed_remote(image_url):
+        async with httpx.AsyncClient(timeout=10, follow_redirects=False) as client:
+            async with client.stream("GET", image_url) as response:
+                response.raise_for_status()
+                if response.is_redirect:
+                    raise ValueError("Redirects are not followed for source images")
+                chunks = []
+                size = 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > IMAGE_SOURCE_MAX_BYTES:
+                        raise ValueError("Source image is too large")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+    raise ValueError(f"Unsupported image_url: {image_url}")
+
+
+def _read_file(path: str) -> bytes:
+    if os.path.getsize(path) > IMAGE_SOURCE_MAX_BYTES:
+        raise ValueError("Source image is too large")
+    with open(path, "rb") as file:
+        return file.read()
+
+
+thumbnails = ThumbnailService(DerivativeCache())
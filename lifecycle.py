@@ -0,0 +1,166 @@
+"""Прогрев воркера при старте и аккуратная остановка.
+
+До того как воркер начнёт принимать запросы, открываются и проверяются
+DB_WARMUP_CONNECTIONS соединений пула (вместе с интроспекцией типов asyncpg
+и подготовкой частых запросов) и компилируются все шаблоны. /ready отвечает
+200 только после прогрева и до начала остановки, так что балансировщик не
+шлёт трафик холодному или уходящему воркеру. Готовность зависит только от
+основной базы, прогрев реплики — по возможности.
+"""
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import select
+
+from config import (
+    DB_POOL_SIZE, DB_WARMUP_CONNECTIONS, SHUTDOWN_DRAIN_TIMEOUT, SHUTDOWN_GRACE_PERIOD, WARMUP_RETRY_INTERVAL, WARMUP_TIMEOUT,
+)
+from models import OTP, Furniture, User
+
+logger = logging.getLogger(__name__)
+
+# Запросы с enum-колонками: на каждом соединении asyncpg один раз запрашивает описание типов
+WARMUP_STATEMENTS = [
+    select(Furniture.c.id, Furniture.c.category, Furniture.c.material, Furniture.c.manufacturer).limit(0),
+    select(User.c.id, User.c.status).limit(0),
+    select(OTP.c.id, OTP.c.purpose).limit(0),
+]
+
+
+async def warm_pool(engine, connections: int = DB_WARMUP_CONNECTIONS) -> None:
+    # Соединения держатся открытыми одновременно, иначе пул отдавал бы одно и то же
+    connections = min(connections, DB_POOL_SIZE)
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(await engine.connect())
+        await asyncio.gather(*(warm_connection(connection) for connection in opened))
+    finally:
+        for connection in opened:
+            await connection.close()
+
+
+async def warm_connection(connection) -> None:
+    for stmt in WARMUP_STATEMENTS:
+        await connection.execute(stmt)
+    await connection.rollback()
+
+
+def precompile_templates(templates) -> int:
+    # get_template компилирует шаблон и кладёт его в кэш окружения Jinja2
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+
+class Lifecycle:
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        # Запросы в работе; считает InFlightMiddleware, не зависит от метрик
+        self.in_flight = 0
+        self._retry: Optional[asyncio.Task] = None
+        self._replica_warm_up: Optional[asyncio.Task] = None
+        self._shutdown: Optional[asyncio.Task] = None
+
+    @property
+    def accepting(self) -> bool:
+        return self.ready and not self.draining
+
+    async def startup(self, engine, templates, replica_engine=None) -> None:
+        start = time.perf_counter()
+        count = precompile_templates(templates)
+        self.install_signal_handlers()
+        if replica_engine is not None:
+            # Реплика не влияет на готовность: без неё чтения идут в основную базу
+            self._replica_warm_up = asyncio.create_task(self.warm_replica(replica_engine))
+        try:
+            await asyncio.wait_for(warm_pool(engine), WARMUP_TIMEOUT)
+        except Exception as e:
+            # База ещё недоступна: воркер стартует неготовым и прогревается в фоне
+            logger.warning("warm-up failed, retrying every %.0fs: %s", WARMUP_RETRY_INTERVAL, e)
+            self._retry = asyncio.create_task(self.retry_warm_up(engine))
+            return
+        self.ready = True
+        logger.info("worker ready: %d templates, %d connections in %.2fs",
+                    count, min(DB_WARMUP_CONNECTIONS, DB_POOL_SIZE), time.perf_counter() - start)
+
+    async def warm_replica(self, engine) -> None:
+        try:
+            await asyncio.wait_for(warm_pool(engine), WARMUP_TIMEOUT)
+        except Exception as e:
+            logger.warning("replica warm-up failed, reads fall back to primary until it recovers: %s", e)
+
+    async def retry_warm_up(self, engine) -> None:
+        while not self.ready:
+            await asyncio.sleep(WARMUP_RETRY_INTERVAL)
+            try:
+                await asyncio.wait_for(warm_pool(engine), WARMUP_TIMEOUT)
+            except Exception as e:
+                logger.warning("warm-up failed: %s", e)
+                continue
+            self.ready = True
+            logger.info("worker ready after delayed warm-up")
+
+    def install_signal_handlers(self) -> None:
+        # uvicorn (и gunicorn-воркер) по SIGTERM сразу перестаёт принимать соединения, а
+        # lifespan shutdown запускает уже после этого. Перехватываем сигнал раньше: сначала
+        # /ready отдаёт 503 и воркер ещё SHUTDOWN_GRACE_PERIOD обслуживает трафик, пока
+        # балансировщик его не выведет, и только потом сигнал уходит серверу.
+        if threading.current_thread() is not threading.main_thread():
+            return
+        # SIGINT (Ctrl+C при разработке) не трогаем — останавливаемся сразу
+        loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def handler(signum, frame):
+            if self._shutdown is not None:
+                # Повторный сигнал — останавливаемся сразу
+                forward_signal(previous, signum, frame)
+                return
+            loop.call_soon_threadsafe(self.begin_shutdown, previous, signum, frame)
+
+        signal.signal(signal.SIGTERM, handler)
+
+    def begin_shutdown(self, previous, signum, frame) -> None:
+        if self._shutdown is None:
+            self._shutdown = asyncio.create_task(self.shutdown_after_grace(previous, signum, frame))
+
+    async def shutdown_after_grace(self, previous, signum, frame) -> None:
+        self.draining = True
+        logger.info("signal %s: not ready, serving for %.0fs before shutdown", signum, SHUTDOWN_GRACE_PERIOD)
+        await asyncio.sleep(SHUTDOWN_GRACE_PERIOD)
+        await self.wait_in_flight(SHUTDOWN_DRAIN_TIMEOUT)
+        forward_signal(previous, signum, frame)
+
+    async def wait_in_flight(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.in_flight > 0:
+            logger.warning("shutdown with %d requests still in flight", self.in_flight)
+
+    async def drain(self, timeout: float = SHUTDOWN_DRAIN_TIMEOUT) -> None:
+        # Без сигнала (например, остановка тестового клиента) сюда приходим сразу
+        self.draining = True
+        for task in (self._retry, self._replica_warm_up):
+            if task is not None:
+                task.cancel()
+        await self.wait_in_flight(timeout)
+
+
+def forward_signal(previous, signum, frame) -> None:
+    if callable(previous):
+        previous(signum, frame)
+    elif previous == signal.SIG_DFL:
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+lifecycle = Lifecycle()
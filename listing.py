@@ -0,0 +1,148 @@
+"""Страницы категорий: фильтры, сортировки и keyset-пагинация.
+
+Ключ курсора — (значение сортировки, id), для сортировки по умолчанию
+только (id,), как и раньше. "popular" сортирует по счётчикам из views.py. Каждой поддерживаемой комбинации фильтров и
+сортировки соответствует индекс из миграции e2a7c9d4b1f8; проверка планов —
+benchmarks/check_plans.py.
+"""
+from math import ceil
+from typing import Annotated, Literal, NamedTuple, Optional
+from urllib.parse import urlencode
+
+from fastapi import HTTPException, status
+from pydantic import BeforeValidator
+from sqlalchemy import func, select, tuple_
+
+from cache import category_counter, listing_count_cache, may_cache
+from database import AsyncSession
+from facets import FacetFilters
+from models import CategoryEnum, CountryEnum, Furniture, FurnitureViews, MaterialEnum
+from pagination import ITEMS_PER_PAGE, NEXT, PREV, decode_cursor, encode_cursor
+
+# search_vector не выбираем: в шаблонах он не нужен
+CARD_COLUMNS = (Furniture.c.id, Furniture.c.fullname, Furniture.c.description, Furniture.c.price, Furniture.c.image_url)
+
+# sort -> (ключ сортировки, по убыванию ли); последний столбец ключа всегда id товара
+SORTS = {
+    "default": ((Furniture.c.id,), False),
+    "price_asc": ((Furniture.c.price, Furniture.c.id), False),
+    "price_desc": ((Furniture.c.price, Furniture.c.id), True),
+    "name": ((Furniture.c.fullname, Furniture.c.id), False),
+    # Счётчики из furniture_views, индекс ix_furniture_views_category_views
+    "popular": ((FurnitureViews.c.views, FurnitureViews.c.furniture_id), True),
+}
+SortName = Literal["default", "price_asc", "price_desc", "name", "popular"]
+
+
+class ListingParams(NamedTuple):
+    material: Optional[MaterialEnum] = None
+    manufacturer: Optional[CountryEnum] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    sort: str = "default"
+
+    def filters(self, category: CategoryEnum) -> FacetFilters:
+        return FacetFilters(category, self.material, self.manufacturer, self.min_price, self.max_price)
+
+    def query_string(self) -> str:
+        # Для ссылок пагинации: фильтры и сортировка сохраняются между страницами
+        params = {name: getattr(value, "value", value) for name, value in self._asdict().items() if value is not None}
+        if params.get("sort") == "default":
+            del params["sort"]
+        return urlencode(params)
+
+
+def empty_to_none(value):
+    # Форма фильтров отправляет пустые поля как "material=&min_price="
+    return value if value != "" else None
+
+
+def listing_params(material: Annotated[Optional[MaterialEnum], BeforeValidator(empty_to_none)] = None,
+                     manufacturer: Annotated[Optional[CountryEnum], BeforeValidator(empty_to_none)] = None,
+                      min_price: Annotated[Optional[float], BeforeValidator(empty_to_none)] = None,
+                       max_price: Annotated[Optional[float], BeforeValidator(empty_to_none)] = None,
+                        sort: SortName = "default") -> ListingParams:
+    return ListingParams(material, manufacturer, min_price, max_price, sort)
+
+
+def listing_statement(filters: FacetFilters, sort: str, key: Optional[list], direction: str, page: int = 1):
+    order, descending = SORTS[sort]
+    if key is not None and len(key) != len(order):
+        # курсор от другой сортировки
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    stmt = select(*CARD_COLUMNS, *sort_only_columns(order)).where(*filters.where()).limit(ITEMS_PER_PAGE)
+    if order[0].table is FurnitureViews:
+        stmt = stmt.join(FurnitureViews, FurnitureViews.c.furniture_id == Furniture.c.id).where(
+            FurnitureViews.c.category == filters.category
+        )
+    if key is None:
+        # OFFSET остаётся только для старых ссылок вида ?page=N без курсора
+        return stmt.order_by(*(col.desc() if descending else col for col in order)).offset((page - 1) * ITEMS_PER_PAGE)
+    # Для PREV идём в обратную сторону и разворачиваем страницу в get_category_page
+    forward = (direction == NEXT) != descending
+    boundary = tuple_(*order) > tuple_(*key) if forward else tuple_(*order) < tuple_(*key)
+    return stmt.where(boundary).order_by(*(col if forward else col.desc() for col in order))
+
+
+def sort_key_types(sort: str) -> tuple:
+    # Курсор от другой сортировки (или подделанный) не совпадёт по длине или типам -> 400
+    order, _ = SORTS[sort]
+    return tuple(col.type.python_type for col in order)
+
+
+def sort_only_columns(order) -> list:
+    # Столбцы ключа, которых нет среди CARD_COLUMNS, нужны в SELECT для курсора
+    return [col for col in order if not any(col is card for card in CARD_COLUMNS)]
+
+
+def listing_count_statement(filters: FacetFilters):
+    return select(func.count()).select_from(Furniture).where(*filters.where())
+
+
+async def count_items(session: AsyncSession, filters: FacetFilters) -> int:
+    if filters == FacetFilters(filters.category):
+        return await category_counter.get(session, filters.category)
+    count = listing_count_cache.get(filters)
+    if count is None:
+        count = await session.scalar(listing_count_statement(filters))
+        if may_cache(session):
+            listing_count_cache.set(filters, count)
+    return count
+
+
+async def get_category_page(session: AsyncSession, category: CategoryEnum, page: int, cursor: Optional[str],
+                            params: ListingParams = ListingParams()) -> dict:
+    filters = params.filters(category)
+    total_pages = ceil(await count_items(session, filters) / ITEMS_PER_PAGE)
+
+    key, direction = decode_cursor(cursor, sort_key_types(params.sort))
+    result = await session.execute(listing_statement(filters, params.sort, key, direction, page))
+    rows = result.fetchall()
+    if direction == PREV:
+        rows.reverse()
+
+    order, _ = SORTS[params.sort]
+
+    def row_key(row):
+        return tuple(row._mapping[col] for col in order)
+
+    items = [
+        {
+            "id": row.id,
+            "title": row.fullname,
+            "description": row.description,
+            "price": row.price,
+            "image_url": row.image_url
+        }
+        for row in rows
+    ]
+    return {
+        "items": items,
+        "current_page": page,
+        "total_pages": total_pages,
+        "next_cursor": encode_cursor(row_key(rows[-1]), NEXT) if rows and page < total_pages else None,
+        "prev_cursor": encode_cursor(row_key(rows[0]), PREV) if rows and page > 1 else None,
+        "params": params,
+        "filter_query": params.query_string(),
+    }
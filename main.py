@@ -1,35 +1,73 @@
-from fastapi import FastAPI, HTTPException, Request, status
-from fastapi.staticfiles import StaticFiles
-from auth import validate_authorization_header
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from api import api_router
+from assets import AssetStaticFiles
+from config import LOG_LEVEL, OTP_PURGE_INTERVAL, VIEW_FLUSH_INTERVAL
+from database import engine, replica_engine
+from images import thumbnails
+from lifecycle import lifecycle
+from metrics import instrument_engine
+from middleware import AuthMiddleware, InFlightMiddleware, MetricsMiddleware, PageCacheMiddleware, ReadYourWritesMiddleware
+from outbox import outbox_worker
+from querylog import QueryLogMiddleware, instrument_query_log
+from related import related_index, related_worker
 from routers import router
+from tasks import PeriodicTask, purge_expired_otps
+from templating import templates
+from views import view_counter
 
-app = FastAPI()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+logger = logging.getLogger(__name__)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.include_router(router)
 
-@app.middleware("http")
-async def auth_middleware(request: Request, call_next):
-    endpoints = ["/login", "/register"]  # Эндпоинты, не требующие аутентификации
-    if request.url.path not in endpoints:
-        # Извлекаем токен из куков
-        access_token = request.cookies.get("access_token")
-        token = request.cookies.get("Authorization")
-        if not token:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-        
-        # Удаляем префикс "Bearer " перед проверкой
-        token = token.replace("Bearer ", "")
-        
-        # Валидация токена
-        try:
-            payload = validate_authorization_header(token)
-            print(f"Token payload: {payload}")
-        except Exception as e:
-            print(f"Token validation failed: {e}")
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    # else:
-    #     response = RedirectResponse(url="/main")
-    # Продолжение выполнения запроса
-    response = await call_next(request)
-    return response
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    engines = [engine] if replica_engine is None else [engine, replica_engine]
+    await lifecycle.startup(engine, templates, replica_engine)
+    background = [
+        PeriodicTask("otp-purge", purge_expired_otps, OTP_PURGE_INTERVAL),
+        PeriodicTask("view-flush", view_counter.flush, VIEW_FLUSH_INTERVAL),
+        outbox_worker,
+        related_worker,
+    ]
+    for task in background:
+        task.start()
+    yield
+    await lifecycle.drain()
+    for task in background:
+        await task.stop()
+    try:
+        await view_counter.flush()
+    except Exception:
+        logger.exception("final view counter flush failed, %d ids lost", len(view_counter))
+    try:
+        await related_index.flush()
+    except Exception:
+        # Отметки остаются в furniture_related_dirty, их пересчитает следующий запуск
+        logger.exception("final related items flush failed")
+    thumbnails.shutdown()
+    for db_engine in engines:
+        await db_engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+app.mount("/static", AssetStaticFiles(directory="static"), name="static")
+app.include_router(router)
+app.include_router(api_router)
+# Первым добавленный — ближе всех к приложению: кэш страниц работает уже после проверки токена
+app.add_middleware(PageCacheMiddleware)
+app.add_middleware(AuthMiddleware)
+if replica_engine is not None:
+    app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(MetricsMiddleware)
+# Снаружи всех: в счёт запроса входит и поиск пользователя в AuthMiddleware
+app.add_middleware(QueryLogMiddleware)
+app.add_middleware(InFlightMiddleware)
+instrument_engine(engine)
+instrument_query_log(engine)
+if replica_engine is not None:
+    instrument_engine(replica_engine)
+    instrument_query_log(replica_engine)
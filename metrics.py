@@ -0,0 +1,173 @@
+"""Метрики в текстовом формате Prometheus.
+
+Свой минимальный реестр вместо prometheus_client: счётчики, gauge и
+гистограммы с метками, всё в памяти процесса (на каждый воркер свои).
+"""
+import bisect
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import event
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счётчики по корзинам..., +Inf], сумма
+        self._values: Dict[LabelValues, Tuple[List[int], float]] = {}
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+
+    def total(self, *labels: str) -> float:
+        entry = self._values.get(labels)
+        return entry[1] if entry else 0.0
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[labels] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {total:g}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+registry: List[Metric] = []
+# Вызываются перед выводом: обновляют gauge, которые дешевле считать по запросу
+collectors: List[Callable[[], None]] = []
+
+
+def register_collector(collector: Callable[[], None]) -> None:
+    collectors.append(collector)
+
+
+def render_metrics() -> str:
+    for collector in collectors:
+        collector()
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_requests_total = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+page_cache_requests_total = Counter("page_cache_requests_total", "Catalog page cache lookups by result.", ("result",))
+template_render_seconds = Histogram("template_render_seconds", "Jinja2 template render time.", ("template",))
+db_statement_duration_seconds = Histogram("db_statement_duration_seconds", "Database statement execution time.", ("statement",))
+db_pool_wait_seconds = Histogram("db_pool_wait_seconds", "Time spent waiting for a pooled database connection.")
+db_read_routing_total = Counter("db_read_routing_total", "Read-only sessions by target database.", ("target",))
+db_pool_connections = Gauge("db_pool_connections", "Pooled database connections by state.", ("state",))
+rate_limited_total = Counter("rate_limited_total", "Requests rejected by the rate limiter.", ("route", "scope"))
+furniture_views_recorded_total = Counter("furniture_views_recorded_total", "Product detail views counted in memory.")
+furniture_views_flushed_total = Counter("furniture_views_flushed_total", "Product views written to furniture_views.")
+furniture_views_pending = Gauge("furniture_views_pending", "Product ids with views not yet flushed.")
+furniture_related_rebuilt_total = Counter("furniture_related_rebuilt_total", "Products whose related items list was rebuilt.")
+outbox_messages_total = Counter("outbox_messages_total", "Outbox deliveries by kind and result (sent, retry, dead).", ("kind", "result"))
+outbox_batch_duration_seconds = Histogram("outbox_batch_duration_seconds", "Time to deliver one outbox batch.")
+otp_purged_total = Counter("otp_purged_total", "Expired OTP rows deleted by the purge task.")
+otp_purge_duration_seconds = Histogram("otp_purge_duration_seconds", "Duration of one OTP purge run.")
+
+
+STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+"?(\w+)', re.IGNORECASE)
+
+
+def statement_label(statement: str) -> str:
+    # "SELECT furniture", "INSERT otp": операция + первая таблица, без параметров
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+    match = STATEMENT_TABLE.search(statement)
+    return f"{operation} {match.group(1)}" if match else operation
+
+
+def instrument_engine(engine) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and hasattr(context, "query_start"):
+            db_statement_duration_seconds.observe(time.perf_counter() - context.query_start, statement_label(statement))
@@ -0,0 +1,278 @@
+import hashlib
+import logging
+import re
+import time
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.requests import cookie_parser
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from auth import resolve_principal
+from cache import catalog_version, page_cache
+from config import AUTH_PUBLIC_PATHS, AUTH_PUBLIC_PREFIXES, PAGE_CACHE_MAX_ENTRY_BYTES, READ_YOUR_WRITES_SECONDS
+from database import READ_YOUR_WRITES_COOKIE
+from lifecycle import lifecycle
+from metrics import http_request_duration_seconds, http_requests_in_flight, http_requests_total, page_cache_requests_total
+from views import view_counter
+
+logger = logging.getLogger(__name__)
+
+
+class AuthMiddleware:
+    """Проверка токена из cookie "Authorization" на уровне ASGI.
+
+    В отличие от @app.middleware("http") не создаёт Request и не оборачивает
+    ответ в поток, а публичные пути (статика, логин, регистрация) пропускает
+    сразу по таблице.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        public_paths: Iterable[str] = AUTH_PUBLIC_PATHS,
+        public_prefixes: Iterable[str] = AUTH_PUBLIC_PREFIXES,
+    ):
+        self.app = app
+        self.public_paths = frozenset(path for path in public_paths if path)
+        self.public_prefixes = tuple(prefix.rstrip("/") + "/" for prefix in public_prefixes if prefix)
+
+    def is_public(self, path: str) -> bool:
+        return path in self.public_paths or path.startswith(self.public_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.is_public(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                token = cookie_parser(value.decode("latin-1")).get("Authorization")
+                break
+        if not token:
+            await self.reject(scope, receive, send, status.HTTP_401_UNAUTHORIZED, "Not authenticated")
+            return
+
+        try:
+            principal = await resolve_principal(token.replace("Bearer ", ""))
+        except HTTPException as e:
+            await self.reject(scope, receive, send, e.status_code, e.detail)
+            return
+        # request.state.user в обработчиках
+        scope.setdefault("state", {})["user"] = principal
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def reject(scope: Scope, receive: Receive, send: Send, status_code: int, detail: str) -> None:
+        logger.debug("auth rejected path=%s status=%s detail=%s", scope["path"], status_code, detail)
+        response = JSONResponse(status_code=status_code, content={"detail": detail})
+        await response(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """Латентность, статусы и число запросов в работе по шаблону маршрута."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            # Роутер кладёт совпавший маршрут в тот же scope; Mount (/static) — только root_path
+            route = scope.get("route")
+            if route is not None:
+                label = route.path
+            elif "app_root_path" in scope:
+                label = scope["root_path"]
+            else:
+                label = "unmatched"
+            method = scope["method"]
+            http_request_duration_seconds.observe(time.perf_counter() - start, method, label)
+            http_requests_total.inc(method, label, str(status_code))
+
+
+class InFlightMiddleware:
+    """Считает запросы в работе для lifecycle.drain, включая дочитывание потоковых ответов."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        lifecycle.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            lifecycle.in_flight -= 1
+
+
+class ReadYourWritesMiddleware:
+    """После успешного изменяющего запроса ставит cookie, по которой
+    get_read_session ещё READ_YOUR_WRITES_SECONDS читает из основной базы."""
+
+    SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+    def __init__(self, app: ASGIApp, window: int = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.window = window
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in self.SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = int(time.time()) + self.window
+                cookie = f"{READ_YOUR_WRITES_COOKIE}={until}; Max-Age={self.window}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class CachedPage(NamedTuple):
+    version: tuple
+    etag: str
+    headers: List[Tuple[bytes, bytes]]
+    body: bytes
+    route: object
+
+
+class PageCacheMiddleware:
+    """Кэш отрендеренных страниц каталога с ETag.
+
+    Попадание в кэш и совпавший If-None-Match (304) обслуживаются здесь,
+    без сессии БД и Jinja2. ETag — хэш тела, поэтому у всех воркеров он
+    одинаковый. Обычный ответ при промахе буферизуется и получает ETag сразу,
+    потоковый отдаётся как есть и кэшируется по завершении. Кэш сбрасывается invalidate_catalog; запись из другого
+    воркера — по общей версии catalog_state, не позже чем через CATALOG_VERSION_CHECK_INTERVAL.
+    """
+
+    CACHEABLE = re.compile(r"^/(?:tables|chairs|beds)(?:/(?P<id>\d+))?$")
+    CACHE_CONTROL = (b"cache-control", b"no-cache")
+
+    def __init__(self, app: ASGIApp, max_entry_bytes: int = PAGE_CACHE_MAX_ENTRY_BYTES):
+        self.app = app
+        self.max_entry_bytes = max_entry_bytes
+
+    @staticmethod
+    def key(scope: Scope) -> tuple:
+        # Порядок параметров в URL не важен
+        query = scope.get("query_string", b"").decode("latin-1")
+        return scope["path"], tuple(sorted(parse_qsl(query, keep_blank_values=True)))
+
+    @staticmethod
+    def if_none_match(scope: Scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                return value.decode("latin-1")
+        return None
+
+    @staticmethod
+    def etag_matches(header: Optional[str], etag: str) -> bool:
+        return header is not None and (header.strip() == "*" or etag in (tag.strip() for tag in header.split(",")))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        match = self.CACHEABLE.match(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if match is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = self.key(scope)
+        await catalog_version.refresh()
+        version = catalog_version.value
+        if_none_match = self.if_none_match(scope)
+        page = page_cache.get(key)
+        if page is not None and page.version == version:
+            # Обработчик не вызывается, поэтому просмотр товара считаем здесь
+            if match.group("id"):
+                view_counter.record(int(match.group("id")))
+            scope["route"] = page.route
+            if self.etag_matches(if_none_match, page.etag):
+                page_cache_requests_total.inc("not_modified")
+                await self.send_not_modified(send, page.etag)
+            else:
+                page_cache_requests_total.inc("hit")
+                await send({"type": "http.response.start", "status": 200, "headers": page.headers})
+                await send({"type": "http.response.body", "body": page.body})
+            return
+
+        page_cache_requests_total.inc("miss")
+        start_message = None
+        streaming = False
+        chunks = []
+
+        async def send_wrapper(message):
+            nonlocal start_message, streaming
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+            if streaming:
+                await send(message)
+            elif more_body:
+                # Потоковый ответ (StreamingTemplateResponse) не задерживаем ради ETag:
+                # первые байты уходят сразу, ETag получат следующие запросы из кэша
+                streaming = True
+                headers = list(start_message.get("headers", []))
+                if start_message["status"] == 200:
+                    headers.append(self.CACHE_CONTROL)
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": b"".join(chunks), "more_body": True})
+            if more_body:
+                return
+            body = b"".join(chunks)
+            page = self.store(key, version, scope, start_message, body)
+            if streaming:
+                return
+            if page is None:
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body})
+            elif self.etag_matches(if_none_match, page.etag):
+                await self.send_not_modified(send, page.etag)
+            else:
+                cookies = [(name, value) for name, value in start_message.get("headers", []) if name == b"set-cookie"]
+                await send({**start_message, "headers": page.headers + cookies})
+                await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def store(self, key, version, scope, start_message, body) -> Optional[CachedPage]:
+        if start_message["status"] != 200:
+            return None
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        headers = [(name, value) for name, value in start_message.get("headers", []) if name != b"set-cookie"]
+        headers += [(b"etag", etag.encode("latin-1")), self.CACHE_CONTROL]
+        page = CachedPage(version, etag, headers, body, scope.get("route"))
+        # Страница с реплики сразу после записи может её не содержать — не кэшируем, как и cache.may_cache
+        replica_read = scope.get("state", {}).get("replica_read", False)
+        if len(body) <= self.max_entry_bytes and not (replica_read and catalog_version.bumped_within(READ_YOUR_WRITES_SECONDS)):
+            page_cache.set(key, page)
+        return page
+
+    async def send_not_modified(self, send: Send, etag: str) -> None:
+        await send({"type": "http.response.start", "status": 304, "headers": [(b"etag", etag.encode("latin-1")), self.CACHE_CONTROL]})
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,26 @@
+"""Add furniture (category, id) index
+
+Revision ID: 5e1f0a9c2b47
+Revises: cbb839783307
+Create Date: 2026-10-17 10:12:41.203118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1f0a9c2b47'
+down_revision: Union[str, None] = 'cbb839783307'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_furniture_category_id', 'furniture', ['category', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_furniture_category_id', table_name='furniture')
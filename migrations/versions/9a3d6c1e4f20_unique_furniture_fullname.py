@@ -0,0 +1,29 @@
+"""Make furniture.fullname unique
+
+Revision ID: 9a3d6c1e4f20
+Revises: 5e1f0a9c2b47
+Create Date: 2026-10-17 11:02:15.518934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a3d6c1e4f20'
+down_revision: Union[str, None] = '5e1f0a9c2b47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Нужен для INSERT ... ON CONFLICT (fullname); при дублях миграция упадёт — их надо убрать вручную
+    op.drop_index('ix_furniture_fullname', table_name='furniture')
+    op.create_index('ix_furniture_fullname', 'furniture', ['fullname'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_furniture_fullname', table_name='furniture')
+    op.create_index('ix_furniture_fullname', 'furniture', ['fullname'], unique=False)
@@ -0,0 +1,37 @@
+"""Add furniture_related table
+
+Revision ID: b7d3f1a8e5c4
+Revises: a4c1e7f2d9b3
+Create Date: 2026-10-17 21:02:13.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d3f1a8e5c4'
+down_revision: Union[str, None] = 'a4c1e7f2d9b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Заполняется после миграции: python related.py rebuild
+    op.create_table('furniture_related',
+    sa.Column('furniture_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['furniture_id'], ['furniture.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_id'], ['furniture.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('furniture_id', 'rank')
+    )
+    op.create_index('ix_furniture_related_related_id', 'furniture_related', ['related_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_furniture_related_related_id', table_name='furniture_related')
+    op.drop_table('furniture_related')
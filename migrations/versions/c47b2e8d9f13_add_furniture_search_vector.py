@@ -0,0 +1,33 @@
+"""Add furniture full-text search vector
+
+Revision ID: c47b2e8d9f13
+Revises: 9a3d6c1e4f20
+Create Date: 2026-10-17 11:48:03.772410
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47b2e8d9f13'
+down_revision: Union[str, None] = '9a3d6c1e4f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('furniture', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('simple', fullname || ' ' || description)", persisted=True),
+    ))
+    op.create_index('ix_furniture_search_vector', 'furniture', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_furniture_search_vector', table_name='furniture', postgresql_using='gin')
+    op.drop_column('furniture', 'search_vector')
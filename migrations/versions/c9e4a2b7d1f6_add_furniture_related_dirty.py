@@ -0,0 +1,31 @@
+"""Add furniture_related_dirty queue
+
+Revision ID: c9e4a2b7d1f6
+Revises: b7d3f1a8e5c4
+Create Date: 2026-10-18 00:24:41.902315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e4a2b7d1f6'
+down_revision: Union[str, None] = 'b7d3f1a8e5c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('furniture_related_dirty',
+    sa.Column('furniture_id', sa.Integer(), nullable=False),
+    sa.Column('expand', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['furniture_id'], ['furniture.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('furniture_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('furniture_related_dirty')
@@ -0,0 +1,50 @@
+"""Add catalog_state version bumped by triggers
+
+Revision ID: d6a2f9c4e8b1
+Revises: c9e4a2b7d1f6
+Create Date: 2026-10-18 01:12:37.520944
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6a2f9c4e8b1'
+down_revision: Union[str, None] = 'c9e4a2b7d1f6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('catalog_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO catalog_state (id) VALUES (1)")
+    # По разу на оператор, а не на строку: импорт пачкой двигает версию один раз.
+    # Новая версия видна вместе с данными — после коммита изменившей их транзакции
+    op.execute("""
+        CREATE FUNCTION catalog_state_bump() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for table in ('furniture', 'furniture_related'):
+        op.execute(f"""
+            CREATE TRIGGER {table}_catalog_state_bump
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION catalog_state_bump()
+        """)
+
+
+def downgrade() -> None:
+    for table in ('furniture', 'furniture_related'):
+        op.execute(f"DROP TRIGGER {table}_catalog_state_bump ON {table}")
+    op.execute("DROP FUNCTION catalog_state_bump()")
+    op.drop_table('catalog_state')
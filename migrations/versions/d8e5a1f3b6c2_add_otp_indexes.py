@@ -0,0 +1,28 @@
+"""Add otp lookup and expiration indexes
+
+Revision ID: d8e5a1f3b6c2
+Revises: c47b2e8d9f13
+Create Date: 2026-10-17 14:05:19.418236
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8e5a1f3b6c2'
+down_revision: Union[str, None] = 'c47b2e8d9f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_otp_user_id_purpose_id', 'otp', ['user_id', 'purpose', 'id'], unique=False)
+    op.create_index('ix_otp_expiration_time', 'otp', ['expiration_time'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_otp_expiration_time', table_name='otp')
+    op.drop_index('ix_otp_user_id_purpose_id', table_name='otp')
@@ -0,0 +1,41 @@
+"""Add covering indexes for filtered and sorted category listings
+
+Revision ID: e2a7c9d4b1f8
+Revises: d8e5a1f3b6c2
+Create Date: 2026-10-17 16:32:47.105933
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c9d4b1f8'
+down_revision: Union[str, None] = 'd8e5a1f3b6c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_furniture_category_id', table_name='furniture')
+    op.create_index('ix_furniture_category_id', 'furniture', ['category', 'id'], unique=False,
+                    postgresql_include=['price', 'material', 'manufacturer'])
+    op.create_index('ix_furniture_category_price_id', 'furniture', ['category', 'price', 'id'], unique=False,
+                    postgresql_include=['material', 'manufacturer'])
+    op.create_index('ix_furniture_category_fullname_id', 'furniture', ['category', 'fullname', 'id'], unique=False,
+                    postgresql_include=['price', 'material', 'manufacturer'])
+    op.create_index('ix_furniture_category_material_price_id', 'furniture', ['category', 'material', 'price', 'id'], unique=False,
+                    postgresql_include=['manufacturer'])
+    op.create_index('ix_furniture_category_manufacturer_price_id', 'furniture', ['category', 'manufacturer', 'price', 'id'], unique=False,
+                    postgresql_include=['material'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_furniture_category_manufacturer_price_id', table_name='furniture')
+    op.drop_index('ix_furniture_category_material_price_id', table_name='furniture')
+    op.drop_index('ix_furniture_category_fullname_id', table_name='furniture')
+    op.drop_index('ix_furniture_category_price_id', table_name='furniture')
+    op.drop_index('ix_furniture_category_id', table_name='furniture')
+    op.create_index('ix_furniture_category_id', 'furniture', ['category', 'id'], unique=False)
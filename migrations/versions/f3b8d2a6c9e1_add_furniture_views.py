@@ -0,0 +1,59 @@
+"""Add furniture_views counters
+
+Revision ID: f3b8d2a6c9e1
+Revises: e2a7c9d4b1f8
+Create Date: 2026-10-17 18:11:26.530874
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d2a6c9e1'
+down_revision: Union[str, None] = 'e2a7c9d4b1f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('furniture_views',
+    sa.Column('furniture_id', sa.Integer(), nullable=False),
+    sa.Column('category', postgresql.ENUM(name='categoryenum', create_type=False), nullable=False),
+    sa.Column('views', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), nullable=True),
+    sa.ForeignKeyConstraint(['furniture_id'], ['furniture.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('furniture_id')
+    )
+    op.execute("""
+        INSERT INTO furniture_views (furniture_id, category)
+        SELECT id, category FROM furniture
+    """)
+    op.create_index('ix_furniture_views_category_views', 'furniture_views', ['category', 'views', 'furniture_id'], unique=False)
+    # Строка счётчика появляется вместе с товаром и следует за сменой категории,
+    # поэтому сортировка "popular" идёт по одному индексу без LEFT JOIN
+    op.execute("""
+        CREATE FUNCTION furniture_views_sync() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO furniture_views (furniture_id, category)
+            VALUES (NEW.id, NEW.category)
+            ON CONFLICT (furniture_id) DO UPDATE SET category = EXCLUDED.category;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER furniture_views_sync
+        AFTER INSERT OR UPDATE OF category ON furniture
+        FOR EACH ROW EXECUTE FUNCTION furniture_views_sync()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER furniture_views_sync ON furniture")
+    op.execute("DROP FUNCTION furniture_views_sync()")
+    op.drop_index('ix_furniture_views_category_views', table_name='furniture_views')
+    op.drop_table('furniture_views')
@@ -2,7 +2,8 @@ from datetime import datetime, timedelta
 from unicodedata import category
 import uuid
 
-from sqlalchemy import UUID, Float, MetaData, Table, Column, Integer, String, TIMESTAMP, ForeignKey, JSON, Boolean, Enum
+from sqlalchemy import UUID, BigInteger, Float, MetaData, Table, Column, Integer, String, TIMESTAMP, ForeignKey, JSON, Boolean, Enum, Index, Computed, func
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from enum import Enum as PyEnum
 
 class CategoryEnum(str, PyEnum):
@@ -42,13 +43,71 @@ Furniture = Table(
     "furniture",
     metadata,
     Column("id", Integer, index=True, primary_key=True, nullable=False),
-    Column("fullname", String, index=True, nullable=False),
+    Column("fullname", String, index=True, unique=True, nullable=False),
     Column("description", String, nullable=False),
     Column("price", Float, nullable=False),
     Column("category", Enum(CategoryEnum), nullable=False),
     Column("material", Enum(MaterialEnum), nullable=False),
     Column("manufacturer", Enum(CountryEnum), nullable=False),
-    Column("image_url", String, nullable=False)
+    Column("image_url", String, nullable=False),
+    Column("search_vector", TSVECTOR, Computed("to_tsvector('simple', fullname || ' ' || description)", persisted=True))
+)
+
+# Страницы категорий: ключ = (category, [фильтр,] сортировка, id), в INCLUDE — колонки
+# остальных фильтров, чтобы COUNT и проверка условий шли index-only. description в индексы
+# не кладём: длинный текст упирается в лимит размера строки btree.
+Index("ix_furniture_category_id", Furniture.c.category, Furniture.c.id,
+      postgresql_include=["price", "material", "manufacturer"])
+Index("ix_furniture_category_price_id", Furniture.c.category, Furniture.c.price, Furniture.c.id,
+      postgresql_include=["material", "manufacturer"])
+Index("ix_furniture_category_fullname_id", Furniture.c.category, Furniture.c.fullname, Furniture.c.id,
+      postgresql_include=["price", "material", "manufacturer"])
+Index("ix_furniture_category_material_price_id", Furniture.c.category, Furniture.c.material, Furniture.c.price, Furniture.c.id,
+      postgresql_include=["manufacturer"])
+Index("ix_furniture_category_manufacturer_price_id", Furniture.c.category, Furniture.c.manufacturer, Furniture.c.price, Furniture.c.id,
+      postgresql_include=["material"])
+Index("ix_furniture_search_vector", Furniture.c.search_vector, postgresql_using="gin")
+
+# Просмотры товаров, копятся в памяти и сбрасываются пачками (views.py). Строка есть у
+# каждого товара (триггер в миграции f3b8d2a6c9e1), category дублируется для индекса "popular".
+FurnitureViews = Table(
+    "furniture_views",
+    metadata,
+    Column("furniture_id", Integer, ForeignKey(Furniture.c.id, ondelete="CASCADE"), primary_key=True),
+    Column("category", Enum(CategoryEnum), nullable=False),
+    Column("views", BigInteger, nullable=False, server_default="0"),
+    Column("updated_at", TIMESTAMP, nullable=True),
+)
+Index("ix_furniture_views_category_views", FurnitureViews.c.category, FurnitureViews.c.views, FurnitureViews.c.furniture_id)
+
+# Похожие товары для страницы товара, пересчитываются related.py; rank 1..RELATED_ITEMS_COUNT.
+# Первичный ключ отдаёт список одного товара уже по порядку, индекс по related_id — кого
+# пересчитать при удалении товара.
+FurnitureRelated = Table(
+    "furniture_related",
+    metadata,
+    Column("furniture_id", Integer, ForeignKey(Furniture.c.id, ondelete="CASCADE"), primary_key=True),
+    Column("rank", Integer, primary_key=True),
+    Column("related_id", Integer, ForeignKey(Furniture.c.id, ondelete="CASCADE"), nullable=False),
+    Column("score", Float, nullable=False),
+)
+Index("ix_furniture_related_related_id", FurnitureRelated.c.related_id)
+# Товары, чьи списки похожих нужно пересчитать. Пишется в той же транзакции, что и изменение
+# каталога, так что падение процесса до пересчёта ничего не теряет; expand — пересчитать
+# ещё и соседей по цене (новый или изменённый товар).
+FurnitureRelatedDirty = Table(
+    "furniture_related_dirty",
+    metadata,
+    Column("furniture_id", Integer, ForeignKey(Furniture.c.id, ondelete="CASCADE"), primary_key=True),
+    Column("expand", Boolean, nullable=False),
+)
+# Одна строка (id = 1): версия каталога, общая для всех воркеров. Её увеличивают
+# триггеры на furniture и furniture_related, кэш страниц сверяется с ней (cache.CatalogVersion)
+CatalogState = Table(
+    "catalog_state",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", BigInteger, nullable=False, server_default="0"),
 )
 
 User = Table(
@@ -73,4 +132,25 @@ OTP = Table(
     Column("user_id", Integer, ForeignKey(User.c.id), nullable=False),
     Column("implementation_time", TIMESTAMP, default=lambda: datetime.utcnow()),
     Column("expiration_time", TIMESTAMP, default=lambda: datetime.utcnow() + timedelta(minutes=1)),
-)
\ No newline at end of file
+)
+# Последний код пользователя для цели — один проход по индексу в обратном порядке id
+Index("ix_otp_user_id_purpose_id", OTP.c.user_id, OTP.c.purpose, OTP.c.id)
+# Для фоновой очистки просроченных кодов
+Index("ix_otp_expiration_time", OTP.c.expiration_time)
+
+# Исходящие письма (outbox.py): строка пишется в той же транзакции, что и событие,
+# и удаляется после отправки; после OUTBOX_MAX_ATTEMPTS неудач status = 'dead'
+Outbox = Table(
+    "outbox",
+    metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("kind", String, nullable=False),
+    Column("recipient", String, nullable=False),
+    Column("payload", JSONB, nullable=False),
+    Column("status", String, nullable=False, server_default="pending"),
+    Column("attempts", Integer, nullable=False, server_default="0"),
+    Column("next_attempt_at", TIMESTAMP, nullable=False, server_default=func.now()),
+    Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+    Column("last_error", String, nullable=True),
+)
+Index("ix_outbox_pending_next_attempt_at", Outbox.c.next_attempt_at, postgresql_where=Outbox.c.status == "pending")
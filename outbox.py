@@ -0,0 +1,258 @@
+"""Отправка писем через таблицу outbox.
+
+Обработчик (регистрация, /otp-create) только добавляет строку в outbox в той
+же транзакции, что и сам OTP, поэтому время ответа зависит от INSERT, а не
+от почтового сервера. Фоновая задача outbox_worker забирает пачки готовых
+строк (FOR UPDATE SKIP LOCKED — воркеры не мешают друг другу), отправляет
+их через одно SMTP-соединение и удаляет отправленные. Неудачные получают
+повтор с экспоненциальной задержкой, после OUTBOX_MAX_ATTEMPTS — status
+'dead' и остаются в таблице с last_error для разбора.
+
+Локально вместо почтового сервера достаточно заглушки на SMTP_PORT:
+
+    python -m aiosmtpd -n -l localhost:1025
+
+и однократного прохода очереди без запуска приложения:
+
+    python outbox.py
+"""
+import asyncio
+import logging
+import random
+import smtplib
+import time
+from contextlib import suppress
+from datetime import timedelta
+from email.message import EmailMessage
+from typing import List, Optional, Sequence
+
+from sqlalchemy import delete, func, insert, literal, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import (
+    EMAIL_BACKEND, EMAIL_FROM, OTP_EXPIRE_MINUTES, OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX, OUTBOX_BATCH_SIZE,
+    OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL, POSTMARK_SERVER_TOKEN, SMTP_HOST, SMTP_PASSWORD,
+    SMTP_PORT, SMTP_STARTTLS, SMTP_TIMEOUT, SMTP_USER,
+)
+from database import async_session_maker
+from metrics import outbox_batch_duration_seconds, outbox_messages_total
+from models import Outbox
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+OTP_EMAIL = "otp_email"
+
+
+def enqueue_otp_email(otp, recipient: str):
+    """CTE для добавления письма с кодом из CTE otp (колонка otp_code).
+
+    Подключается к запросу, создающему OTP, через Select.add_cte(), так что
+    код и письмо появляются в одной транзакции.
+    """
+    source = select(
+        literal(OTP_EMAIL),
+        literal(recipient),
+        func.jsonb_build_object("otp_code", otp.c.otp_code),
+    ).select_from(otp)
+    return insert(Outbox).from_select(["kind", "recipient", "payload"], source).cte("outbox_otp_email")
+
+
+def build_message(row) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = EMAIL_FROM
+    message["To"] = row.recipient
+    if row.kind == OTP_EMAIL:
+        message["Subject"] = "FurnitX: код подтверждения"
+        message.set_content(
+            f"Ваш код подтверждения: {row.payload['otp_code']}\n"
+            f"Код действует {OTP_EXPIRE_MINUTES} мин."
+        )
+    else:
+        raise ValueError(f"Unknown outbox kind: {row.kind}")
+    return message
+
+
+class SmtpSender:
+    """Одно соединение на пачку; smtplib блокирующий, поэтому в отдельном потоке."""
+
+    async def send_batch(self, messages: Sequence[EmailMessage]) -> List[Optional[str]]:
+        return await asyncio.to_thread(self._send_batch, messages)
+
+    def _send_batch(self, messages: Sequence[EmailMessage]) -> List[Optional[str]]:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if SMTP_USER:
+                smtp.login(SMTP_USER, SMTP_PASSWORD or "")
+            errors = []
+            for message in messages:
+                try:
+                    smtp.send_message(message)
+                    errors.append(None)
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Отказ по конкретному адресу не ломает соединение для остальных писем
+                    errors.append(str(e))
+                except smtplib.SMTPResponseException as e:
+                    errors.append(f"{e.smtp_code} {e.smtp_error!r}")
+            return errors
+
+
+class PostmarkSender:
+    """Пачка писем одним запросом к Postmark (пакет postmarker, необязательный)."""
+
+    def __init__(self, token: str):
+        from postmarker.core import PostmarkClient
+
+        self.client = PostmarkClient(server_token=token)
+
+    async def send_batch(self, messages: Sequence[EmailMessage]) -> List[Optional[str]]:
+        emails = [
+            {"From": message["From"], "To": message["To"], "Subject": message["Subject"], "TextBody": message.get_content()}
+            for message in messages
+        ]
+        responses = await asyncio.to_thread(self.client.emails.send_batch, *emails)
+        return [None if response["ErrorCode"] == 0 else response["Message"] for response in responses]
+
+
+def create_sender():
+    if EMAIL_BACKEND == "postmark":
+        return PostmarkSender(POSTMARK_SERVER_TOKEN)
+    return SmtpSender()
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+    # Разброс, чтобы после сбоя сервера повторы не приходили одной волной
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_statement(batch_size: int):
+    # Взятые строки сдвигаются на OUTBOX_LEASE_SECONDS вперёд (аренда, её продлевает
+    # renew_statement): если процесс упадёт посреди отправки, они вернутся в очередь сами
+    ready = (
+        select(Outbox.c.id)
+        .where(Outbox.c.status == "pending", Outbox.c.next_attempt_at <= func.now())
+        .order_by(Outbox.c.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(Outbox)
+        .where(Outbox.c.id.in_(ready.scalar_subquery()))
+        .values(
+            attempts=Outbox.c.attempts + 1,
+            next_attempt_at=func.now() + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+        )
+        .returning(Outbox.c.id, Outbox.c.kind, Outbox.c.recipient, Outbox.c.payload, Outbox.c.attempts)
+    )
+
+
+def renew_statement(ids: Sequence[int]):
+    return (
+        update(Outbox)
+        .where(Outbox.c.id.in_(ids))
+        .values(next_attempt_at=func.now() + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+    )
+
+
+def failure_statement(row, error: str, max_attempts: int):
+    dead = row.attempts >= max_attempts
+    return (
+        update(Outbox)
+        .where(Outbox.c.id == row.id)
+        .values(
+            status="dead" if dead else "pending",
+            next_attempt_at=func.now() + timedelta(seconds=backoff_seconds(row.attempts)),
+            last_error=error[:1000],
+        )
+    )
+
+
+class OutboxDelivery:
+    def __init__(self, batch_size: int = OUTBOX_BATCH_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._sender = None
+
+    @property
+    def sender(self):
+        if self._sender is None:
+            self._sender = create_sender()
+        return self._sender
+
+    async def deliver(self) -> int:
+        sent = 0
+        async with async_session_maker() as session:
+            while True:
+                result = await session.execute(claim_statement(self.batch_size))
+                rows = result.fetchall()
+                await session.commit()
+                if not rows:
+                    break
+                start = time.perf_counter()
+                renewal = asyncio.create_task(self.keep_leased([row.id for row in rows]))
+                try:
+                    errors = await self.send(rows)
+                finally:
+                    renewal.cancel()
+                    with suppress(asyncio.CancelledError):
+                        await renewal
+                outbox_batch_duration_seconds.observe(time.perf_counter() - start)
+
+                delivered = [row.id for row, error in zip(rows, errors) if error is None]
+                if delivered:
+                    await session.execute(delete(Outbox).where(Outbox.c.id.in_(delivered)))
+                for row, error in zip(rows, errors):
+                    if error is None:
+                        outbox_messages_total.inc(row.kind, "sent")
+                        continue
+                    await session.execute(failure_statement(row, error, self.max_attempts))
+                    result_label = "dead" if row.attempts >= self.max_attempts else "retry"
+                    outbox_messages_total.inc(row.kind, result_label)
+                    logger.warning("outbox id=%s %s after attempt %d: %s", row.id, result_label, row.attempts, error)
+                await session.commit()
+                sent += len(delivered)
+                if len(rows) < self.batch_size:
+                    break
+        return sent
+
+    async def keep_leased(self, ids: List[int]) -> None:
+        # Пачка из OUTBOX_BATCH_SIZE писем при медленном сервере (до SMTP_TIMEOUT на команду)
+        # отправляется дольше аренды; без продления другой воркер взял бы её и отправил повторно
+        while True:
+            await asyncio.sleep(OUTBOX_LEASE_SECONDS / 3)
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(renew_statement(ids))
+                    await session.commit()
+            except (OSError, SQLAlchemyError) as e:
+                logger.warning("outbox lease renewal for %d rows failed: %r", len(ids), e)
+
+    async def send(self, rows) -> List[Optional[str]]:
+        messages: List[Optional[EmailMessage]] = []
+        errors: List[Optional[str]] = []
+        for row in rows:
+            try:
+                messages.append(build_message(row))
+                errors.append(None)
+            except Exception as e:
+                messages.append(None)
+                errors.append(f"build: {e}")
+        ready = [message for message in messages if message is not None]
+        try:
+            results = iter(await self.sender.send_batch(ready) if ready else [])
+        except Exception as e:
+            # Сервер недоступен или соединение оборвалось — повторяем всю пачку
+            logger.warning("outbox batch of %d failed: %r", len(ready), e)
+            return [error or repr(e) for error in errors]
+        return [error if message is None else next(results) for message, error in zip(messages, errors)]
+
+
+outbox_delivery = OutboxDelivery()
+outbox_worker = PeriodicTask("outbox", outbox_delivery.deliver, OUTBOX_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Sent {asyncio.run(outbox_delivery.deliver())} messages")
@@ -0,0 +1,51 @@
+import base64
+import json
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+
+ITEMS_PER_PAGE = 3
+SEARCH_RESULTS_PER_PAGE = 20
+
+NEXT = "next"
+PREV = "prev"
+
+
+def encode_cursor(values: Sequence, direction: str = NEXT) -> str:
+    # Курсор = ключ последней (или первой) строки страницы + направление
+    raw = json.dumps({"k": list(values), "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def invalid_cursor() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def matches_type(value, expected: type) -> bool:
+    # bool в JSON — не число; целое допустимо там, где ждём float (rank 0, цена 100)
+    if isinstance(value, bool):
+        return False
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def decode_cursor(cursor: Optional[str], key_types: Optional[Sequence[type]] = None) -> Tuple[Optional[list], str]:
+    """Ключ и направление из курсора; с key_types ключ должен совпасть с ними по длине и типам."""
+    if not cursor:
+        return None, NEXT
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = data["k"], data["d"]
+    except (ValueError, KeyError, TypeError):
+        raise invalid_cursor()
+    if direction not in (NEXT, PREV) or not isinstance(values, list) or not values:
+        raise invalid_cursor()
+    if not all(isinstance(value, (int, float, str)) and not isinstance(value, bool) for value in values):
+        raise invalid_cursor()
+    if key_types is not None and (
+        len(values) != len(key_types) or not all(matches_type(value, expected) for value, expected in zip(values, key_types))
+    ):
+        raise invalid_cursor()
+    return values, direction
@@ -0,0 +1,174 @@
+"""Число запросов к БД и время в них на один HTTP-запрос.
+
+QueryLogMiddleware кладёт в contextvar объект QueryStats, обработчики событий
+движка (instrument_query_log) прибавляют к нему каждый выполненный запрос —
+в том числе из сессий, открытых внутри потоковых ответов и AuthMiddleware.
+С DB_QUERY_DEBUG_HEADER ответ получает заголовки X-DB-Queries и Server-Timing,
+а запросы сверх бюджета маршрута из QUERY_BUDGETS попадают в лог. Запросы
+дольше DB_EXPLAIN_THRESHOLD логируются вместе с EXPLAIN.
+
+Для проверок (benchmarks/check_queries.py) есть assert_max_queries:
+
+    with assert_max_queries(2):
+        await client.get("/tables")
+"""
+import logging
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from config import DB_EXPLAIN_THRESHOLD, DB_QUERY_DEBUG_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Бюджет запросов к БД по маршруту при пустых кэшах каталога и прогретом кэше токенов
+QUERY_BUDGETS: Dict[Tuple[str, str], int] = {
+    ("GET", "/tables"): 2,
+    ("GET", "/tables/{table_id}"): 1,
+    ("GET", "/chairs"): 2,
+    ("GET", "/chairs/{chair_id}"): 1,
+    ("GET", "/beds"): 2,
+    ("GET", "/beds/{bed_id}"): 1,
+    ("GET", "/search"): 1,
+    ("GET", "/facets"): 1,
+    ("GET", "/api/v1/furniture"): 1,
+    ("GET", "/api/v1/furniture/{furniture_id}"): 1,
+    ("POST", "/register"): 1,
+    # Второй запрос — только при пересчёте хэша пароля под новые BCRYPT_ROUNDS
+    ("POST", "/login"): 2,
+    ("POST", "/otp-create"): 1,
+    ("POST", "/otp-check"): 1,
+}
+
+EXPLAINABLE = re.compile(r"^\s*(?:SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+
+class QueryStats:
+    def __init__(self, collect: bool = False):
+        self.count = 0
+        self.seconds = 0.0
+        # Тексты запросов храним только там, где их покажут (assert_max_queries)
+        self.statements: Optional[List[str]] = [] if collect else None
+
+    def add(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+# Активные assert_max_queries: считают все запросы процесса, а не только текущего контекста
+_watchers: List[QueryStats] = []
+
+
+def explain(conn, statement: str, parameters) -> str:
+    # Отдельный курсор DBAPI: события движка не срабатывают и результат исходного запроса не затирается.
+    # EXPLAIN идёт в транзакции запроса, поэтому под SAVEPOINT: его ошибка не прерывает эту транзакцию
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute("SAVEPOINT query_log_explain")
+        try:
+            cursor.execute(f"EXPLAIN {statement}", parameters)
+            return "\n".join(str(row[0]) for row in cursor.fetchall())
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT query_log_explain")
+            raise
+        finally:
+            cursor.execute("RELEASE SAVEPOINT query_log_explain")
+    finally:
+        cursor.close()
+
+
+def instrument_query_log(engine, explain_threshold: Optional[float] = DB_EXPLAIN_THRESHOLD) -> None:
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.query_log_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is None or not hasattr(context, "query_log_start"):
+            return
+        elapsed = time.perf_counter() - context.query_log_start
+        stats = current_stats.get()
+        if stats is not None:
+            stats.add(statement, elapsed)
+        for watcher in _watchers:
+            watcher.add(statement, elapsed)
+
+        if explain_threshold is None or elapsed < explain_threshold or executemany:
+            return
+        # Серверный курсор (stream) ещё читает результат на этом соединении
+        if context.execution_options.get("stream_results") or not EXPLAINABLE.match(statement):
+            logger.warning("slow query %.3fs: %s", elapsed, statement)
+            return
+        try:
+            plan = explain(conn, statement, parameters)
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e!r}"
+        logger.warning("slow query %.3fs: %s\n%s", elapsed, statement, plan)
+
+
+@contextmanager
+def assert_max_queries(limit: int) -> Iterator[QueryStats]:
+    stats = QueryStats(collect=True)
+    _watchers.append(stats)
+    try:
+        yield stats
+    finally:
+        _watchers.remove(stats)
+    if stats.count > limit:
+        listing = "\n".join(f"  {number}. {statement}" for number, statement in enumerate(stats.statements, 1))
+        raise AssertionError(f"{stats.count} queries, expected at most {limit}:\n{listing}")
+
+
+class QueryLogMiddleware:
+    """Заводит QueryStats на запрос; с debug-заголовком отдаёт счётчики клиенту."""
+
+    def __init__(self, app: ASGIApp, debug_header: bool = DB_QUERY_DEBUG_HEADER, budgets: Dict[Tuple[str, str], int] = QUERY_BUDGETS):
+        self.app = app
+        self.debug_header = debug_header
+        self.budgets = budgets
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if self.debug_header and message["type"] == "http.response.start":
+                # У потокового ответа запросы после начала тела в заголовок не попадут — они будут в логе
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.count).encode("latin-1")))
+                headers.append((b"server-timing", f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper if self.debug_header else send)
+        finally:
+            current_stats.reset(token)
+            if self.debug_header:
+                self.check_budget(scope, stats)
+
+    def check_budget(self, scope: Scope, stats: QueryStats) -> None:
+        route = scope.get("route")
+        if route is None:
+            return
+        budget = self.budgets.get((scope["method"], route.path))
+        if budget is not None and stats.count > budget:
+            logger.warning("%s %s: %d queries (budget %d), %.1fms in db",
+                           scope["method"], route.path, stats.count, budget, stats.seconds * 1000)
+        else:
+            logger.debug("%s %s: %d queries, %.1fms in db", scope["method"], route.path, stats.count, stats.seconds * 1000)
@@ -0,0 +1,142 @@
+"""Token bucket для дорогих маршрутов (/login, /register, /otp-check).
+
+Зависимость rate_limit(route) проверяет два ведра — по IP и по аккаунту —
+до хэширования пароля и запросов к БД и отвечает 429 с Retry-After.
+Хранилище подключаемое: MemoryStorage держит вёдра в памяти воркера,
+RedisStorage делит их между воркерами и машинами.
+"""
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request, status
+
+from config import RATE_LIMIT_MAX_KEYS, RATE_LIMIT_STORAGE_URL, RATE_LIMITS
+from metrics import rate_limited_total
+
+
+class Limit(NamedTuple):
+    capacity: int
+    period: float
+
+    @property
+    def refill_rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> Optional["Limit"]:
+        # "5/60" — не больше 5 запросов за 60 секунд, всплеском до 5 сразу
+        if not value:
+            return None
+        capacity, _, period = value.partition("/")
+        return cls(int(capacity), float(period or 1))
+
+
+class MemoryStorage:
+    """Вёдра в памяти процесса; самые давно не использованные ключи вытесняются."""
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        # 0 — запрос пропущен, иначе через сколько секунд появится токен
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.refill_rate)
+        retry_after = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            retry_after = (cost - tokens) / limit.refill_rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Атомарно в Redis: пересчитать токены, списать, вернуть время ожидания (строкой — Lua режет дроби)
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local retry_after = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisStorage:
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(TAKE_SCRIPT)
+
+    async def take(self, key: str, limit: Limit, cost: float = 1) -> float:
+        args = [limit.capacity, limit.refill_rate, time.time(), cost]
+        return float(await self.script(keys=[self.prefix + key], args=args))
+
+
+def create_storage(url: str = RATE_LIMIT_STORAGE_URL):
+    if url.startswith(("redis://", "rediss://")):
+        return RedisStorage(url)
+    return MemoryStorage()
+
+
+storage = create_storage()
+
+
+async def form_account(request: Request) -> Optional[str]:
+    # FastAPI уже разобрал тело для эндпоинта, request.form() отдаёт его из кэша
+    form = await request.form()
+    return form.get("username") or form.get("email")
+
+
+async def json_account(request: Request) -> Optional[str]:
+    try:
+        body = await request.json()
+    except ValueError:
+        return None
+    return body.get("email") if isinstance(body, dict) else None
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
+
+
+def rate_limit(route: str, account: Callable = form_account):
+    ip_limit, account_limit = (Limit.parse(value) for value in RATE_LIMITS[route])
+
+    async def dependency(request: Request) -> None:
+        checks = []
+        if ip_limit is not None:
+            checks.append(("ip", client_ip(request), ip_limit))
+        if account_limit is not None:
+            name = await account(request)
+            if name:
+                checks.append(("account", str(name).strip().lower(), account_limit))
+        for scope, value, limit in checks:
+            retry_after = await storage.take(f"{route}:{scope}:{value}", limit)
+            if retry_after > 0:
+                rate_limited_total.inc(route, scope)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests, try again later",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    return dependency
@@ -0,0 +1,200 @@
+"""Похожие товары на странице товара.
+
+Список для каждого товара хранится в furniture_related: товары той же
+категории, ближайшие по цене (по RELATED_CANDIDATES с каждой стороны, индекс
+ix_furniture_category_price_id), с оценкой за совпадение материала,
+производителя и близость цены. Страница товара читает товар и его список
+одним запросом (detail_statement).
+
+Списки пересчитываются по изменённым товарам: вставка и импорт отмечают
+новые id (пересчитываются они и их соседи по цене — в их списки мог попасть
+новый товар), удаление — товары, в чьих списках был удалённый. Отметки лежат
+в furniture_related_dirty и пишутся тем же запросом, что и изменение, а
+пересчитывает их фоновая задача related_worker.
+После миграции b7d3f1a8e5c4 таблицу заполняют один раз:
+
+    python related.py rebuild
+"""
+import asyncio
+import logging
+import sys
+from typing import Iterable, List
+
+from sqlalchemy import ARRAY, Integer, and_, bindparam, delete, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from cache import catalog_version, page_cache
+from config import RELATED_CANDIDATES, RELATED_ITEMS_COUNT, RELATED_REBUILD_BATCH_SIZE, RELATED_REBUILD_INTERVAL
+from database import async_session_maker
+from metrics import furniture_related_rebuilt_total
+from models import CategoryEnum, Furniture, FurnitureRelated, FurnitureRelatedDirty
+from tasks import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+# Ближайшие по (price, id) товары категории выше и ниже товара s
+NEIGHBOURS = """
+    (SELECT f.id, f.price, f.material, f.manufacturer FROM furniture f
+     WHERE f.category = {s}.category AND (f.price, f.id) > ({s}.price, {s}.id)
+     ORDER BY f.price, f.id LIMIT :candidates)
+    UNION ALL
+    (SELECT f.id, f.price, f.material, f.manufacturer FROM furniture f
+     WHERE f.category = {s}.category AND (f.price, f.id) < ({s}.price, {s}.id)
+     ORDER BY f.price DESC, f.id DESC LIMIT :candidates)
+"""
+
+TARGETS = text(f"""
+    SELECT id FROM furniture WHERE id = ANY(:ids)
+    UNION
+    SELECT n.id FROM furniture s
+    CROSS JOIN LATERAL ({NEIGHBOURS.format(s="s")}) n
+    WHERE s.id = ANY(:new_ids)
+""").bindparams(bindparam("ids", type_=ARRAY(Integer)), bindparam("new_ids", type_=ARRAY(Integer)))
+
+CLEAR = text("DELETE FROM furniture_related WHERE furniture_id = ANY(:targets)").bindparams(
+    bindparam("targets", type_=ARRAY(Integer))
+)
+
+# Материал важнее производителя, близость цены (0..1) разводит равные по ним
+REBUILD = text(f"""
+    INSERT INTO furniture_related (furniture_id, rank, related_id, score)
+    SELECT p.id, c.rank, c.related_id, c.score
+    FROM furniture p
+    CROSS JOIN LATERAL (
+        SELECT scored.id AS related_id, scored.score,
+               row_number() OVER (ORDER BY scored.score DESC, scored.id) AS rank
+        FROM (
+            SELECT n.id,
+                   CASE WHEN n.material = p.material THEN 2 ELSE 0 END
+                   + CASE WHEN n.manufacturer = p.manufacturer THEN 1 ELSE 0 END
+                   + 1 - least(abs(n.price - p.price) / greatest(p.price, 1), 1) AS score
+            FROM ({NEIGHBOURS.format(s="p")}) n
+        ) scored
+        ORDER BY scored.score DESC, scored.id
+        LIMIT :limit
+    ) c
+    WHERE p.id = ANY(:targets)
+""").bindparams(bindparam("targets", type_=ARRAY(Integer)))
+
+
+async def rebuild(session, ids: Iterable[int], new_ids: Iterable[int] = ()) -> int:
+    """Пересчитывает списки ids, а для new_ids — ещё и их соседей; коммит за вызывающим."""
+    result = await session.execute(TARGETS, {"ids": list(ids), "new_ids": list(new_ids), "candidates": RELATED_CANDIDATES})
+    targets = [row.id for row in result]
+    if not targets:
+        return 0
+    await session.execute(CLEAR, {"targets": targets})
+    await session.execute(REBUILD, {"targets": targets, "candidates": RELATED_CANDIDATES, "limit": RELATED_ITEMS_COUNT})
+    return len(targets)
+
+
+def mark_dirty(ids, expand: bool, name: str = "related_dirty"):
+    """CTE, отмечающий товары из ids (Select с одной колонкой id) к пересчёту.
+
+    Подключается к изменяющему каталог запросу через Select.add_cte(), так что
+    отметка сохраняется в той же транзакции, что и изменение.
+    """
+    stmt = pg_insert(FurnitureRelatedDirty).from_select(["furniture_id", "expand"], ids.add_columns(literal(expand)))
+    return stmt.on_conflict_do_update(
+        index_elements=[FurnitureRelatedDirty.c.furniture_id],
+        set_={"expand": FurnitureRelatedDirty.c.expand | stmt.excluded.expand},
+    ).cte(name)
+
+
+def claim_dirty(expand: bool, limit: int):
+    # Строка удаляется в транзакции пересчёта: при ошибке или падении процесса она вернётся.
+    # SKIP LOCKED — воркеры разбирают очередь параллельно, не пересчитывая одно и то же.
+    claimed = (
+        select(FurnitureRelatedDirty.c.furniture_id)
+        .where(FurnitureRelatedDirty.c.expand == expand)
+        .order_by(FurnitureRelatedDirty.c.furniture_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        delete(FurnitureRelatedDirty)
+        .where(FurnitureRelatedDirty.c.furniture_id.in_(claimed.scalar_subquery()))
+        .returning(FurnitureRelatedDirty.c.furniture_id)
+    )
+
+
+class RelatedIndex:
+    def __init__(self, batch_size: int = RELATED_REBUILD_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    async def flush(self) -> int:
+        # У новых товаров соседей до 2 * RELATED_CANDIDATES, поэтому их пачки меньше
+        batches = ((False, self.batch_size), (True, max(1, self.batch_size // (2 * RELATED_CANDIDATES + 1))))
+        rebuilt = 0
+        try:
+            async with async_session_maker() as session:
+                for expand, limit in batches:
+                    while True:
+                        result = await session.execute(claim_dirty(expand, limit))
+                        ids = result.scalars().all()
+                        if not ids:
+                            await session.commit()
+                            break
+                        rebuilt += await (rebuild(session, (), ids) if expand else rebuild(session, ids))
+                        await session.commit()
+                        if len(ids) < limit:
+                            break
+        finally:
+            furniture_related_rebuilt_total.inc(amount=rebuilt)
+            if rebuilt:
+                # Страницы товаров в кэше показывают старые списки
+                catalog_version.bump()
+                page_cache.clear()
+        return rebuilt
+
+    async def rebuild_all(self) -> int:
+        rebuilt = 0
+        last_id = 0
+        async with async_session_maker() as session:
+            while True:
+                result = await session.execute(
+                    select(Furniture.c.id).where(Furniture.c.id > last_id).order_by(Furniture.c.id).limit(self.batch_size)
+                )
+                ids: List[int] = result.scalars().all()
+                if not ids:
+                    break
+                rebuilt += await rebuild(session, ids)
+                await session.commit()
+                last_id = ids[-1]
+                logger.info("rebuilt related items up to id %d", last_id)
+        furniture_related_rebuilt_total.inc(amount=rebuilt)
+        return rebuilt
+
+
+related_index = RelatedIndex()
+related_worker = PeriodicTask("related-rebuild", related_index.flush, RELATED_REBUILD_INTERVAL)
+
+RelatedItem = Furniture.alias("related")
+
+
+def detail_statement(category: CategoryEnum, item_id: int, columns):
+    """Товар и его похожие одним запросом: строка на каждый похожий (или одна без них).
+
+    Товар из другой категории не найдётся, поэтому /tables/<id стула> отдаёт 404.
+    Похожий, сменивший категорию после пересчёта, отбрасывается в JOIN.
+    """
+    return (
+        select(
+            *columns,
+            RelatedItem.c.id.label("related_id"),
+            RelatedItem.c.fullname.label("related_fullname"),
+            RelatedItem.c.price.label("related_price"),
+            RelatedItem.c.image_url.label("related_image_url"),
+        )
+        .outerjoin(FurnitureRelated, FurnitureRelated.c.furniture_id == Furniture.c.id)
+        .outerjoin(RelatedItem, and_(RelatedItem.c.id == FurnitureRelated.c.related_id, RelatedItem.c.category == Furniture.c.category))
+        .where(Furniture.c.id == item_id, Furniture.c.category == category)
+        .order_by(FurnitureRelated.c.rank)
+    )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python related.py rebuild")
+    logging.basicConfig(level=logging.INFO)
+    print(f"Rebuilt related items for {asyncio.run(related_index.rebuild_all())} products")
@@ -1,23 +1,55 @@
-from math import ceil
 from datetime import datetime, timedelta
+import logging
 import random
-from typing import Annotated
+import re
+import uuid
+from typing import Annotated, Literal, NamedTuple, Optional
 from fastapi import APIRouter, Cookie, Depends, FastAPI, Form, HTTPException, Request, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm, HTTPBearer
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from sqlalchemy import func, insert, select, delete
-from auth import create_access_token, get_current_user, get_password_hash, validate_authorization_header, verify_password
-from database import get_async_session, AsyncSession
-from models import Furniture, CountryEnum, MaterialEnum, CategoryEnum, OTPPurposeEnum, StatusEnum, User, OTP
-from schemas import CreateUser, GetAllTables, GetAllTablesResponse, InsertFurniture, InsertFurnitureResponse, LoginRequest, OTPCheckFields, TokenResponse, UserAuth, UserData, UserDataResponse
+import httpx
+from sqlalchemy import func, insert, literal, select, delete, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from cache import invalidate_catalog
+from catalog_import import import_catalog
+from facets import FacetFilters, compute_facets
+from lifecycle import lifecycle
+from listing import CARD_COLUMNS, ListingParams, get_category_page, listing_params
+from images import FORMATS as IMAGE_FORMATS, derivable, image_version, thumbnails
+from auth import create_access_token, get_current_user, hash_password, revoke_token, validate_authorization_header, verify_and_update_password
+from config import OTP_EXPIRE_MINUTES, THUMBNAIL_WIDTHS
+from database import async_session_maker, get_async_session, get_read_session, pool_status, AsyncSession
+from models import Furniture, FurnitureRelated, CountryEnum, MaterialEnum, CategoryEnum, OTPPurposeEnum, StatusEnum, User, OTP
+from views import view_counter
+from outbox import enqueue_otp_email, outbox_worker
+from related import detail_statement, mark_dirty, related_worker
+from ratelimit import json_account, rate_limit
+from pagination import SEARCH_RESULTS_PER_PAGE, decode_cursor, encode_cursor
+from metrics import render_metrics
+from templating import templates
+from schemas import CatalogImportReport, CreateUser, FacetsResponse, GetAllTables, GetAllTablesResponse, InsertFurniture, InsertFurnitureResponse, LoginRequest, OTPCheckFields, SearchResponse, SearchResult, TokenResponse, UserAuth, UserData, UserDataResponse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
 # router.mount("/static", StaticFiles(directory="static"), name="static")
 http_bearer = HTTPBearer()
 
+class CategoryPage(NamedTuple):
+    title: str
+    path: str
+    slug: str
+
+# Категории, у которых есть свои страницы; шаблоны category.html и detail.html общие
+CATEGORY_PAGES = {
+    CategoryEnum.TABLE: CategoryPage("Tables", "/tables", "table"),
+    CategoryEnum.CHAIR: CategoryPage("Chairs", "/chairs", "chair"),
+    CategoryEnum.BED: CategoryPage("Beds", "/beds", "bed"),
+}
+CATEGORY_PATHS = {category: page.path for category, page in CATEGORY_PAGES.items()}
+
+
 @router.post("/insert_item")
 async def insert_item(fullname: str, 
                         description: str, 
@@ -27,13 +59,8 @@ async def insert_item(fullname: str,
                            manufacturer: CountryEnum,
                             image_url: str,
                              session: AsyncSession = Depends(get_async_session)):
-    stmt_check = select(Furniture.c.fullname).where(Furniture.c.fullname == fullname)
-    result_check = await session.execute(stmt_check)
-    row_check = result_check.fetchone()
-    if row_check is not None:
-        raise HTTPException(status_code=200, detail="Table already exists")
-    
-    stmt = insert(Furniture).values(
+    # Один запрос: уникальный индекс по fullname вместо предварительной проверки
+    inserted = pg_insert(Furniture).values(
         fullname = fullname,
         description = description,
         price = price,
@@ -41,13 +68,18 @@ async def insert_item(fullname: str,
         material = material,
         manufacturer = manufacturer,
         image_url = image_url
-    )
-    await session.execute(stmt)
+    ).on_conflict_do_nothing(index_elements=[Furniture.c.fullname]).returning(
+        Furniture.c.id, Furniture.c.fullname, Furniture.c.description, Furniture.c.price, Furniture.c.category,
+        Furniture.c.material, Furniture.c.manufacturer, Furniture.c.image_url
+    ).cte("inserted")
+    stmt = select(inserted).add_cte(mark_dirty(select(inserted.c.id), expand=True))
+    result = await session.execute(stmt)
+    row = result.fetchone()
     await session.commit()
-    stmt_response = select(Furniture).where(Furniture.c.fullname == fullname)
-    result_response = await session.execute(stmt_response)
-    row = result_response.fetchone()
-    print(row)
+    if row is None:
+        raise HTTPException(status_code=200, detail="Table already exists")
+    invalidate_catalog(category)
+    related_worker.wake()
     data = InsertFurniture(
         fullname=row.fullname,
         description=row.description,
@@ -59,170 +91,188 @@ async def insert_item(fullname: str,
     )
     return InsertFurnitureResponse(data=data)
 
-@router.get("/tables", response_class=HTMLResponse)
-async def get_tables(request: Request, session: AsyncSession = Depends(get_async_session), page: int = 1):
-    items_per_page = 3
-    offset = (page - 1) * items_per_page 
-
-    total_items = await session.scalar(select(func.count()).select_from(Furniture).where(Furniture.c.category == CategoryEnum.TABLE))
-    total_pages = ceil(total_items / items_per_page)
-
-    stmt_get_all = (
-        select(Furniture.c.id, Furniture.c.fullname, Furniture.c.description, Furniture.c.price, Furniture.c.image_url)
-        .where(Furniture.c.category == CategoryEnum.TABLE)
-        .offset(offset)
-        .limit(items_per_page)
-    )
-    result_get_all = await session.execute(stmt_get_all)
-    rows = result_get_all.fetchall()
+@router.post("/catalog/import", response_model=CatalogImportReport)
+async def bulk_import(request: Request,
+                        format: Literal["ndjson", "csv"] = "ndjson",
+                         on_conflict: Literal["skip", "update"] = "skip",
+                          session: AsyncSession = Depends(get_async_session)):
+    # Тело запроса читается потоком, файл целиком в память не загружается
+    return await import_catalog(session, request.stream(), format, on_conflict)
+
+async def render_category(request: Request, session: AsyncSession, category: CategoryEnum, page: int, cursor: Optional[str], params: ListingParams):
+    listing = await get_category_page(session, category, page, cursor, params)
+
+    return templates.StreamingTemplateResponse("category.html", {
+        "request": request,
+        "category": CATEGORY_PAGES[category],
+        "items": listing["items"],
+        "current_page": listing["current_page"],
+        "total_pages": listing["total_pages"],
+        "next_cursor": listing["next_cursor"],
+        "prev_cursor": listing["prev_cursor"],
+        "params": listing["params"],
+        "filter_query": listing["filter_query"]
+    })
+
+async def render_detail(request: Request, session: AsyncSession, category: CategoryEnum, item_id: int):
+    # Товар и похожие товары (related.py) одним запросом
+    result = await session.execute(detail_statement(category, item_id, CARD_COLUMNS))
+    rows = result.fetchall()
     
-    tables = [
-        {
-            "id": row.id,
-            "title": row.fullname,
-            "description": row.description,
-            "price": row.price,
-            "image_url": row.image_url
-        }
-        for row in rows
+    if not rows:
+        return HTMLResponse(content=f"{category.value.capitalize()} not found", status_code=404)
+    item = rows[0]
+    # Только счётчик в памяти: запись в базу делает фоновая задача (views.py)
+    view_counter.record(item.id)
+
+    item_data = {
+        "title": item.fullname,
+        "description": item.description,
+        "price": item.price,
+        "image_url": item.image_url
+    }
+    related = [
+        {"id": row.related_id, "title": row.related_fullname, "price": row.related_price, "image_url": row.related_image_url}
+        for row in rows if row.related_id is not None
     ]
     
-    return templates.TemplateResponse("tables.html", {
+    return templates.StreamingTemplateResponse("detail.html", {
         "request": request,
-        "tables": tables,
-        "current_page": page,
-        "total_pages": total_pages
+        "category": CATEGORY_PAGES[category],
+        "item": item_data,
+        "related": related
     })
 
+@router.get("/tables", response_class=HTMLResponse)
+async def get_tables(request: Request, session: AsyncSession = Depends(get_read_session), page: int = 1, cursor: Optional[str] = None, params: ListingParams = Depends(listing_params)):
+    return await render_category(request, session, CategoryEnum.TABLE, page, cursor, params)
+
 @router.get("/tables/{table_id}", response_class=HTMLResponse)
-async def get_table_detail(table_id: int, request: Request, session: AsyncSession = Depends(get_async_session)):
-    stmt = select(Furniture).where(Furniture.c.id == table_id)
-    result = await session.execute(stmt)
-    table = result.fetchone()
-    
-    if table is None:
-        return HTMLResponse(content="Table not found", status_code=404)
-
-    table_data = {
-        "title": table.fullname,
-        "description": table.description,
-        "price": table.price,
-        "image_url": table.image_url
-    }
-    
-    return templates.TemplateResponse("table_detail.html", {"request": request, "table": table_data})
+async def get_table_detail(table_id: int, request: Request, session: AsyncSession = Depends(get_read_session)):
+    return await render_detail(request, session, CategoryEnum.TABLE, table_id)
 
 @router.get("/chairs", response_class=HTMLResponse)
-async def get_chairs(request: Request, session: AsyncSession = Depends(get_async_session), page: int = 1):
-    items_per_page = 3
-    offset = (page - 1) * items_per_page 
-
-    total_items = await session.scalar(select(func.count()).select_from(Furniture).where(Furniture.c.category == CategoryEnum.CHAIR))
-    total_pages = ceil(total_items / items_per_page)
-
-    stmt_get_all = (
-        select(Furniture.c.id, Furniture.c.fullname, Furniture.c.description, Furniture.c.price, Furniture.c.image_url)
-        .where(Furniture.c.category == CategoryEnum.CHAIR)
-        .offset(offset)
-        .limit(items_per_page)
-    )
-    result_get_all = await session.execute(stmt_get_all)
-    rows = result_get_all.fetchall()
-    
-    chairs = [
-        {
-            "id": row.id,
-            "title": row.fullname,
-            "description": row.description,
-            "price": row.price,
-            "image_url": row.image_url
-        }
-        for row in rows
-    ]
-
-    return templates.TemplateResponse("chairs.html", {
-        "request": request,
-        "chairs": chairs,
-        "current_page": page,
-        "total_pages": total_pages
-    })
+async def get_chairs(request: Request, session: AsyncSession = Depends(get_read_session), page: int = 1, cursor: Optional[str] = None, params: ListingParams = Depends(listing_params)):
+    return await render_category(request, session, CategoryEnum.CHAIR, page, cursor, params)
 
 @router.get("/chairs/{chair_id}", response_class=HTMLResponse)
-async def get_chair_detail(chair_id: int, request: Request, session: AsyncSession = Depends(get_async_session)):
-    stmt = select(Furniture).where(Furniture.c.id == chair_id)
-    result = await session.execute(stmt)
-    chair = result.fetchone()
-    
-    if chair is None:
-        return HTMLResponse(content="Chair not found", status_code=404)
-
-    chair_data = {
-        "title": chair.fullname,
-        "description": chair.description,
-        "price": chair.price,
-        "image_url": chair.image_url
-    }
-    
-    return templates.TemplateResponse("chair_detail.html", {"request": request, "chair": chair_data})
+async def get_chair_detail(chair_id: int, request: Request, session: AsyncSession = Depends(get_read_session)):
+    return await render_detail(request, session, CategoryEnum.CHAIR, chair_id)
 
 @router.get("/beds", response_class=HTMLResponse)
-async def get_bed(request: Request, session: AsyncSession = Depends(get_async_session), page: int = 1):
-    items_per_page = 3
-    offset = (page - 1) * items_per_page 
-
-    total_items = await session.scalar(select(func.count()).select_from(Furniture).where(Furniture.c.category == CategoryEnum.BED))
-    total_pages = ceil(total_items / items_per_page)
-
-    stmt_get_all = (
-        select(Furniture.c.id, Furniture.c.fullname, Furniture.c.description, Furniture.c.price, Furniture.c.image_url)
-        .where(Furniture.c.category == CategoryEnum.BED)
-        .offset(offset)
-        .limit(items_per_page)
-    )
-    result_get_all = await session.execute(stmt_get_all)
-    rows = result_get_all.fetchall()
-    
-    beds = [
-        {
-            "id": row.id,
-            "title": row.fullname,
-            "description": row.description,
-            "price": row.price,
-            "image_url": row.image_url
-        }
-        for row in rows
-    ]
+async def get_bed(request: Request, session: AsyncSession = Depends(get_read_session), page: int = 1, cursor: Optional[str] = None, params: ListingParams = Depends(listing_params)):
+    return await render_category(request, session, CategoryEnum.BED, page, cursor, params)
 
-    return templates.TemplateResponse("beds.html", {
+@router.get("/beds/{bed_id}", response_class=HTMLResponse)
+async def get_bed_detail(bed_id: int, request: Request, session: AsyncSession = Depends(get_read_session)):
+    return await render_detail(request, session, CategoryEnum.BED, bed_id)
+
+def search_query(q: str) -> Optional[str]:
+    # Каждое слово как префикс: "дуб ст" -> "дуб:* & ст:*"
+    terms = re.findall(r"\w+", q.lower())[:10]
+    return " & ".join(f"{term}:*" for term in terms) or None
+
+@router.get("/images/{furniture_id}/{width}.{fmt}")
+async def get_thumbnail(furniture_id: int, width: int, fmt: Literal["webp", "jpeg"], v: Optional[str] = None):
+    if width not in THUMBNAIL_WIDTHS:
+        return HTMLResponse(content="Unsupported width", status_code=404)
+    # С версией в URL готовый файл отдаётся без обращения к БД; его ключ содержит v,
+    # то есть это картинка именно этой версии и её можно кэшировать навсегда
+    path = thumbnails.cached(furniture_id, v, width, fmt) if v else None
+    immutable = path is not None
+    if path is None:
+        async with async_session_maker() as session:
+            image_url = await session.scalar(select(Furniture.c.image_url).where(Furniture.c.id == furniture_id))
+        if image_url is None:
+            return HTMLResponse(content="Image not found", status_code=404)
+        try:
+            path = await thumbnails.derivative(furniture_id, image_url, width, fmt)
+        except (ValueError, OSError, httpx.HTTPError) as e:
+            logger.warning("thumbnail failed furniture_id=%s image_url=%s error=%s", furniture_id, image_url, e)
+            if not derivable(image_url):
+                return HTMLResponse(content="Image not available", status_code=404)
+            # Источник из разрешённых, но сейчас недоступен: пусть браузер покажет оригинал
+            return RedirectResponse(url=image_url, status_code=302, headers={"Cache-Control": "no-store"})
+        # Устаревший или выдуманный v получает текущую картинку, но не на год
+        immutable = v == image_version(image_url)
+    cache_control = "public, max-age=31536000, immutable" if immutable else "public, max-age=86400"
+    return FileResponse(path, media_type=IMAGE_FORMATS[fmt], headers={"Cache-Control": cache_control})
+
+@router.get("/search")
+async def search(request: Request,
+                    q: str = "",
+                     cursor: Optional[str] = None,
+                      format: Optional[Literal["html", "json"]] = None,
+                       session: AsyncSession = Depends(get_read_session)):
+    results = []
+    next_cursor = None
+    query = search_query(q)
+    if query is not None:
+        tsquery = func.to_tsquery("simple", query)
+        ranked = (
+            select(*CARD_COLUMNS, Furniture.c.category, func.ts_rank(Furniture.c.search_vector, tsquery).label("rank"))
+            .where(Furniture.c.search_vector.op("@@")(tsquery))
+            .subquery()
+        )
+        stmt = select(ranked).order_by(ranked.c.rank.desc(), ranked.c.id.desc()).limit(SEARCH_RESULTS_PER_PAGE)
+        # (rank, id) последней строки предыдущей страницы
+        key, _ = decode_cursor(cursor, (float, int))
+        if key is not None:
+            stmt = stmt.where(tuple_(ranked.c.rank, ranked.c.id) < tuple_(*key))
+        result = await session.execute(stmt)
+        rows = result.fetchall()
+        results = [
+            SearchResult(
+                id=row.id,
+                title=row.fullname,
+                description=row.description,
+                price=row.price,
+                image_url=row.image_url,
+                category=row.category,
+                url=f"{CATEGORY_PATHS[row.category]}/{row.id}" if row.category in CATEGORY_PATHS else None
+            )
+            for row in rows
+        ]
+        if len(rows) == SEARCH_RESULTS_PER_PAGE:
+            next_cursor = encode_cursor((rows[-1].rank, rows[-1].id))
+
+    if format == "json" or (format is None and "application/json" in request.headers.get("accept", "")):
+        return SearchResponse(data=results, next_cursor=next_cursor)
+    return templates.TemplateResponse("search.html", {
         "request": request,
-        "beds": beds,
-        "current_page": page,
-        "total_pages": total_pages
+        "q": q,
+        "results": results,
+        "next_cursor": next_cursor
     })
 
-@router.get("/beds/{bed_id}", response_class=HTMLResponse)
-async def get_chair_detail(bed_id: int, request: Request, session: AsyncSession = Depends(get_async_session)):
-    stmt = select(Furniture).where(Furniture.c.id == bed_id)
-    result = await session.execute(stmt)
-    bed = result.fetchone()
-    
-    if bed is None:
-        return HTMLResponse(content="Bed not found", status_code=404)
-
-    bed_data = {
-        "title": bed.fullname,
-        "description": bed.description,
-        "price": bed.price,
-        "image_url": bed.image_url
-    }
-    
-    return templates.TemplateResponse("bed_detail.html", {"request": request, "bed": bed_data})
+@router.get("/facets", response_model=FacetsResponse)
+async def get_facets(category: Optional[CategoryEnum] = None,
+                       material: Optional[MaterialEnum] = None,
+                        manufacturer: Optional[CountryEnum] = None,
+                         min_price: Optional[float] = None,
+                          max_price: Optional[float] = None,
+                           session: AsyncSession = Depends(get_read_session)):
+    filters = FacetFilters(category, material, manufacturer, min_price, max_price)
+    return await compute_facets(session, filters)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@router.get("/health/pool")
+async def health_pool():
+    return pool_status()
+
+@router.get("/ready")
+async def ready():
+    # Для балансировщика: 503 до окончания прогрева и с начала остановки
+    if not lifecycle.accepting:
+        return JSONResponse({"ready": False, "draining": lifecycle.draining}, status_code=503)
+    return {"ready": True}
 
 @router.get("/main", response_class=HTMLResponse)
 async def main_page(request: Request, Authorization: str = Cookie(None)):
-    print("/main TEST")
-    print("Authorization:", Authorization)
-    print("END /main TEST")
+    logger.debug("main page authorization_cookie=%s", Authorization is not None)
     return templates.TemplateResponse("index.html", {
         "request": request,
         # "user": current_user
@@ -234,118 +284,142 @@ async def test(request: Request):
 
 @router.delete("/delete")
 async def delete_item(id: int, session: AsyncSession = Depends(get_async_session)):
-    stmt_delete = delete(Furniture).where(Furniture.c.id == id)
-    await session.execute(stmt_delete)
+    deleted_item = delete(Furniture).where(Furniture.c.id == id).returning(Furniture.c.id, Furniture.c.category).cte("deleted_item")
+    # Списки, где был удалённый товар, отмечаются тем же запросом (CTE видит их до каскадного удаления)
+    referencing = select(FurnitureRelated.c.furniture_id).where(FurnitureRelated.c.related_id == deleted_item.c.id)
+    stmt_delete = select(deleted_item.c.category).add_cte(mark_dirty(referencing, expand=False))
+    result_delete = await session.execute(stmt_delete)
+    deleted = result_delete.fetchone()
     await session.commit()
+    if deleted is not None:
+        invalidate_catalog(deleted.category)
+        related_worker.wake()
 
 @router.get("/register", response_class=HTMLResponse)
 async def show_registration_form(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 
-@router.post("/register", response_class=HTMLResponse)
+@router.post("/register", response_class=HTMLResponse, dependencies=[Depends(rate_limit("register"))])
 async def create_user(request: Request, user_fields: CreateUser = Form(...), session: AsyncSession = Depends(get_async_session)):
-    hash_password = get_password_hash(user_fields.password)
-    check = select(User).where(User.c.email == user_fields.email)
-    result = await session.execute(check)
-    row = result.fetchone()
-    # print(some)
-    if row is not None:
-        raise HTTPException(status_code=400, detail="User already exists")
-    stmt = insert(User).values(
-        fullname = user_fields.fullname,
-        email = user_fields.email,
-        hashed_password = hash_password,
-        status = StatusEnum.CONTACT_VERIFICATION
+    hashed_password = await hash_password(user_fields.password)
+    # Пользователь и OTP создаются одним запросом (CTE); при занятом email CTE ничего не вставит
+    new_user = (
+        pg_insert(User).values(
+            user_uuid = uuid.uuid4(),
+            fullname = user_fields.fullname,
+            email = user_fields.email,
+            hashed_password = hashed_password,
+            status = StatusEnum.CONTACT_VERIFICATION
+        )
+        .on_conflict_do_nothing(index_elements=[User.c.email])
+        .returning(User.c.id, User.c.user_uuid)
+        .cte("new_user")
     )
-    await session.execute(stmt)
-    await session.commit()
-    stmt_uuid = select(User.c.user_uuid).where(user_fields.email == User.c.email)
-    result_uuid = await session.execute(stmt_uuid)
-    uuid = result_uuid.fetchone()[0]
-    get_response = UserData(
-        user_uuid=uuid,
-        email=user_fields.email
+    new_otp = otp_insert(new_user.c.id).cte("new_otp")
+    stmt = (
+        select(new_user.c.id, new_user.c.user_uuid)
+        .join_from(new_user, new_otp, new_otp.c.user_id == new_user.c.id)
+        # Письмо с кодом ставится в outbox тем же запросом; отправляет его outbox_worker
+        .add_cte(enqueue_otp_email(new_otp, user_fields.email))
     )
-    response = UserDataResponse(data=get_response)
-    stmt_test = select(User.c.fullname, User.c.email,
-    ).where(user_fields.email == User.c.email)
-    result_test = await session.execute(stmt_test)
-    row_test = result_test.fetchone()
-    test = {
-        "fullname": row_test.fullname,
-        "email": row_test.email,
-    }
-    stmt_id = select(User.c.id).where(User.c.email == user_fields.email)
-    result_stmt_id = await session.execute(stmt_id)
-    row_id = result_stmt_id.fetchone()[0]
+    result = await session.execute(stmt)
+    row = result.fetchone()
+    await session.commit()
+    if row is None:
+        raise HTTPException(status_code=400, detail="User already exists")
+    outbox_worker.wake()
 
-    access_token = create_access_token(data={"sub": row_id, "email": user_fields.email})
+    access_token = create_access_token(data={"sub": row.id, "email": user_fields.email})
 
     response = RedirectResponse(url="/main", status_code=303)
     response.set_cookie(key="access_token", value=f"Bearer {access_token}", httponly=True)
     response.headers["Authorization"] = f"Bearer {access_token}"
-    await otp_create(email=user_fields.email, session=session)
     return response
 
 @router.get("/login", response_class=HTMLResponse)
 async def show_login_form(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
-@router.post("/login", response_class=HTMLResponse)
+@router.post("/login", response_class=HTMLResponse, dependencies=[Depends(rate_limit("login"))])
 async def login(request: Request, login_form: LoginRequest = Form(...), session: AsyncSession = Depends(get_async_session)):
     stmt = select(User.c.id, User.c.email, User.c.hashed_password).where(User.c.email == login_form.username)
     result = await session.execute(stmt)
     user = result.fetchone()
-    if user is None or not verify_password(login_form.password, user[2]):
+    if user is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    verified, new_hash = await verify_and_update_password(login_form.password, user[2])
+    if not verified:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid username or password")
+    if new_hash is not None:
+        # Стоимость bcrypt в конфиге изменилась — сохраняем хэш с новыми rounds
+        await session.execute(update(User).where(User.c.id == user[0]).values(hashed_password=new_hash))
+        await session.commit()
 
     access_token = create_access_token(data={"sub": user[0], "email": user[1]})
-    print(user[0])
+    logger.debug("login user_id=%s", user[0])
     response = RedirectResponse(url="/main", status_code=303)
     response.set_cookie(key="Authorization", value=f"Bearer {access_token}", httponly=True) # Setting JWT to Cookie file
     response.headers["Authorization"] = f"Bearer {access_token}" # Setting JWT to header
-    print("Authorization: ", response.headers["Authorization"])
     return response
 
+@router.get("/logout")
+async def logout(Authorization: str = Cookie(None)):
+    if Authorization:
+        revoke_token(Authorization.replace("Bearer ", ""))
+    response = RedirectResponse(url="/login", status_code=303)
+    response.delete_cookie(key="Authorization")
+    return response
+
+def otp_insert(user_id, *criteria, purpose: OTPPurposeEnum = OTPPurposeEnum.USER_REGISTER):
+    # INSERT ... SELECT: user_id берётся из запроса, а не отдельным SELECT
+    now = datetime.utcnow()
+    source = select(
+        literal(purpose, OTP.c.purpose.type),
+        literal(random.randint(1000, 9999)),
+        user_id,
+        literal(now),
+        literal(now + timedelta(minutes=OTP_EXPIRE_MINUTES)),
+    ).where(*criteria)
+    return (
+        insert(OTP)
+        .from_select(["purpose", "otp_code", "user_id", "implementation_time", "expiration_time"], source)
+        .returning(OTP.c.user_id, OTP.c.otp_code)
+    )
+
 @router.post("/otp-create")
 async def otp_create(email: str, session: AsyncSession = Depends(get_async_session)):
-    print("OTP CREATE TEST")
-    stmt_user = select(User.c.id, User.c.email).where(email == User.c.email) # id and email
-    result_user = await session.execute(stmt_user)
-    row_user = result_user.fetchone()
-    # print(row)
-    if row_user[1] is None: # email
-        raise HTTPException(status_code=400, detail="No such user")
-    stmt_insert = insert(OTP).values(
-        purpose = OTPPurposeEnum.USER_REGISTER,
-        otp_code = random.randint(1000,9999),
-        user_id = row_user[0] # user id
-    )
-    await session.execute(stmt_insert)
+    new_otp = otp_insert(User.c.id, User.c.email == email).cte("new_otp")
+    # Код уходит только письмом (outbox); в ответе его быть не должно
+    stmt = select(new_otp.c.user_id).add_cte(enqueue_otp_email(new_otp, email))
+    result = await session.execute(stmt)
+    row = result.fetchone()
     await session.commit()
-    # stmt_exp = select(OTP.c.expiration_time).where(OTP.c.email == email)
-    # result_exp = await session.execute(stmt_exp)
-    # row_exp = result_exp.fetchone()[0]
-
-    return {"status": 200, "details": f"OTP: {OTP.c.otp_code}"}
+    if row is None:
+        raise HTTPException(status_code=400, detail="No such user")
+    outbox_worker.wake()
+    return {"status": 200, "details": "OTP sent"}
 
 @router.get("/otp", response_class=HTMLResponse)
 async def otp_get(request: Request):
     return templates.TemplateResponse("otp.html", {"request": request})
 
-@router.post("/otp-check", response_class=HTMLResponse)
+@router.post("/otp-check", response_class=HTMLResponse, dependencies=[Depends(rate_limit("otp_check", json_account))])
 async def otp_check(fields: OTPCheckFields, request: Request, session: AsyncSession = Depends(get_async_session)):
-    stmt_user = select(User.c.user_uuid, User.c.id, User.c.email, OTP.c.purpose).join(OTP, OTP.c.user_id == User.c.id).where(User.c.user_uuid == fields.user_uuid, User.c.email == fields.email, OTP.c.purpose == fields.purpose)
-    result_user = await session.execute(stmt_user)
-    row_user = result_user.fetchone()
-    if row_user is None:
+    # Один запрос: последний код пользователя для этой цели (индекс ix_otp_user_id_purpose_id)
+    stmt = (
+        select(OTP.c.otp_code, OTP.c.expiration_time)
+        .join(User, OTP.c.user_id == User.c.id)
+        .where(User.c.user_uuid == fields.user_uuid, User.c.email == fields.email, OTP.c.purpose == fields.purpose)
+        .order_by(OTP.c.id.desc())
+        .limit(1)
+    )
+    result = await session.execute(stmt)
+    row = result.fetchone()
+    if row is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No such user")
-    stmt_otp = select(OTP.c.expiration_time).where(row_user[1] == OTP.c.user_id).order_by(OTP.c.id.desc())
-    result_otp = await session.execute(stmt_otp)
-    row_otp = result_otp.fetchone()[0]
-    if row_otp < datetime.utcnow():
+    if row.expiration_time < datetime.utcnow():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OTP code time is expired")
-    if row_otp != fields.otp_code:
+    if str(row.otp_code) != fields.otp_code.strip():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Wrong OTP code")
     return templates.TemplateResponse("otp.html", {"request": request})
     
@@ -27,6 +27,40 @@ class InsertFurniture(BaseModel):
     manufacturer: CountryEnum
     image_url: str
 
+class CatalogImportError(BaseModel):
+    line: int
+    error: str
+
+class CatalogImportReport(BaseModel):
+    received: int = 0
+    loaded: int = 0
+    failed: int = 0
+    errors: List[CatalogImportError] = []
+    errors_truncated: bool = False
+
+class SearchResult(BaseModel):
+    id: int
+    title: str
+    description: str
+    price: float
+    image_url: str
+    category: CategoryEnum
+    url: Optional[str] = None
+
+class SearchResponse(BaseModel):
+    data: List[SearchResult]
+    next_cursor: Optional[str] = None
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class FacetsResponse(BaseModel):
+    category: List[FacetCount]
+    material: List[FacetCount]
+    manufacturer: List[FacetCount]
+    price: List[FacetCount]
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str
@@ -57,4 +91,14 @@ class UserData(BaseModel):
     email: str
 
 class UserDataResponse(BaseModel):
-    data: UserData
\ No newline at end of file
+    data: UserData
+
+class FurnitureItem(InsertFurniture):
+    id: int
+
+class FurnitureItemResponse(BaseModel):
+    data: FurnitureItem
+
+class FurnitureListResponse(BaseModel):
+    data: List[FurnitureItem]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,85 @@
+"""Периодические фоновые задачи процесса; запускаются и останавливаются в lifespan (main.py)."""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import delete, select
+
+from config import OTP_PURGE_BATCH_SIZE, OTP_RETENTION_MINUTES
+from database import async_session_maker
+from metrics import otp_purge_duration_seconds, otp_purged_total
+from models import OTP
+
+logger = logging.getLogger(__name__)
+
+# Пауза между пачками DELETE, чтобы очистка не занимала базу подряд
+PURGE_BATCH_PAUSE = 0.05
+
+
+class PeriodicTask:
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval: float):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.func()
+            except Exception:
+                # Ошибка одного запуска не должна останавливать задачу
+                logger.exception("periodic task %s failed", self.name)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def wake(self) -> None:
+        # Запустить следующий проход сразу, не дожидаясь интервала
+        self._wake.set()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+async def purge_expired_otps(batch_size: int = OTP_PURGE_BATCH_SIZE) -> int:
+    # Удаляем небольшими пачками, каждая в своей короткой транзакции; SKIP LOCKED
+    # позволяет нескольким воркерам чистить таблицу одновременно без ожиданий
+    cutoff = datetime.utcnow() - timedelta(minutes=OTP_RETENTION_MINUTES)
+    expired = (
+        select(OTP.c.id)
+        .where(OTP.c.expiration_time < cutoff)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    stmt = delete(OTP).where(OTP.c.id.in_(expired.scalar_subquery()))
+    purged = 0
+    start = time.perf_counter()
+    async with async_session_maker() as session:
+        while True:
+            result = await session.execute(stmt)
+            await session.commit()
+            purged += result.rowcount
+            otp_purged_total.inc(amount=result.rowcount)
+            if result.rowcount < batch_size:
+                break
+            await asyncio.sleep(PURGE_BATCH_PAUSE)
+    otp_purge_duration_seconds.observe(time.perf_counter() - start)
+    if purged:
+        logger.info("purged %d expired OTP rows", purged)
+    return purged
@@ -0,0 +1,77 @@
+import os
+import time
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from starlette.responses import StreamingResponse
+
+from assets import asset_url
+from config import JINJA_CACHE_DIR, TEMPLATE_STREAM_CHUNK_BYTES
+from images import CARD_SIZES, has_thumbnails, thumbnail_srcset, thumbnail_url
+from metrics import template_render_seconds
+from models import CountryEnum, MaterialEnum
+
+# {{ flush() }} в шаблоне: отдать всё накопленное клиенту (обычно сразу после <head>)
+FLUSH_MARKER = "<!--flush-->"
+
+
+def flush() -> Markup:
+    return Markup(FLUSH_MARKER)
+
+
+class InstrumentedTemplates(Jinja2Templates):
+    """Jinja2Templates, который пишет время рендера в template_render_seconds."""
+
+    def TemplateResponse(self, *args, **kwargs):
+        # Поддерживаются обе сигнатуры: (name, context) и (request, name, context)
+        name = kwargs.get("name") or (args[0] if args and isinstance(args[0], str) else args[1])
+        start = time.perf_counter()
+        response = super().TemplateResponse(*args, **kwargs)
+        template_render_seconds.observe(time.perf_counter() - start, name)
+        return response
+
+    def StreamingTemplateResponse(self, name: str, context: dict, status_code: int = 200) -> StreamingResponse:
+        """Отдаёт страницу кусками: до {{ flush() }} сразу, дальше по TEMPLATE_STREAM_CHUNK_BYTES.
+
+        Генератор синхронный, поэтому Starlette рендерит его в пуле потоков,
+        не занимая event loop.
+        """
+        template = self.get_template(name)
+        return StreamingResponse(self.render_chunks(name, template, context), status_code=status_code, media_type="text/html")
+
+    @staticmethod
+    def render_chunks(name, template, context):
+        start = time.perf_counter()
+        buffer = []
+        size = 0
+        for piece in template.generate(context):
+            if FLUSH_MARKER in piece:
+                head, _, piece = piece.partition(FLUSH_MARKER)
+                buffer.append(head)
+                yield "".join(buffer).encode()
+                buffer, size = [], 0
+            buffer.append(piece)
+            size += len(piece)
+            if size >= TEMPLATE_STREAM_CHUNK_BYTES:
+                yield "".join(buffer).encode()
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer).encode()
+        template_render_seconds.observe(time.perf_counter() - start, name)
+
+
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+templates = InstrumentedTemplates(directory="templates")
+# Байткод шаблонов переживает перезапуск: новые воркеры не компилируют шаблоны заново
+templates.env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+templates.env.globals["asset_url"] = asset_url
+templates.env.globals["flush"] = flush
+templates.env.globals["has_thumbnails"] = has_thumbnails
+templates.env.globals["thumbnail_url"] = thumbnail_url
+templates.env.globals["thumbnail_srcset"] = thumbnail_srcset
+templates.env.globals["thumbnail_sizes"] = CARD_SIZES
+# Варианты для формы фильтров на страницах категорий (_filters.html)
+templates.env.globals["materials"] = list(MaterialEnum)
+templates.env.globals["manufacturers"] = list(CountryEnum)
+templates.env.globals["sorts"] = [("default", "Default"), ("price_asc", "Price: low to high"), ("price_desc", "Price: high to low"), ("name", "Name"), ("popular", "Most viewed")]
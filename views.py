@@ -0,0 +1,78 @@
+"""Счётчик просмотров карточек товаров с отложенной записью.
+
+Обработчик страницы товара только увеличивает число в словаре; фоновая
+задача раз в VIEW_FLUSH_INTERVAL одним INSERT ... ON CONFLICT на пачку
+прибавляет накопленное к furniture_views. UPDATE на каждый просмотр
+упирался бы в блокировки одной и той же строки у популярных товаров.
+"""
+import logging
+from typing import Dict
+
+from sqlalchemy import BigInteger, Integer, column, func, select, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from config import VIEW_FLUSH_BATCH_SIZE
+from database import async_session_maker
+from metrics import furniture_views_flushed_total, furniture_views_pending, furniture_views_recorded_total, register_collector
+from models import Furniture, FurnitureViews
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    def __init__(self, batch_size: int = VIEW_FLUSH_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pending: Dict[int, int] = {}
+
+    def record(self, furniture_id: int) -> None:
+        self._pending[furniture_id] = self._pending.get(furniture_id, 0) + 1
+        furniture_views_recorded_total.inc()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def upsert(self, batch):
+        deltas = values(column("furniture_id", Integer), column("views", BigInteger), name="deltas").data(batch)
+        # JOIN с furniture отбрасывает удалённые товары и берёт их категорию;
+        # порядок по id — чтобы воркеры блокировали строки в одном порядке
+        source = (
+            select(Furniture.c.id, Furniture.c.category, deltas.c.views, func.now())
+            .join(deltas, deltas.c.furniture_id == Furniture.c.id)
+            .order_by(Furniture.c.id)
+        )
+        stmt = pg_insert(FurnitureViews).from_select(["furniture_id", "category", "views", "updated_at"], source)
+        return stmt.on_conflict_do_update(
+            index_elements=[FurnitureViews.c.furniture_id],
+            set_={"views": FurnitureViews.c.views + stmt.excluded.views, "updated_at": stmt.excluded.updated_at},
+        )
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        items = sorted(pending.items())
+        flushed = 0
+        try:
+            async with async_session_maker() as session:
+                for start in range(0, len(items), self.batch_size):
+                    batch = items[start:start + self.batch_size]
+                    await session.execute(self.upsert(batch))
+                    await session.commit()
+                    flushed += len(batch)
+                    furniture_views_flushed_total.inc(amount=sum(views for _, views in batch))
+        except Exception:
+            # Незаписанное возвращаем в счётчик, попробуем в следующий раз
+            for furniture_id, views in items[flushed:]:
+                self._pending[furniture_id] = self._pending.get(furniture_id, 0) + views
+            raise
+        return flushed
+
+
+view_counter = ViewCounter()
+
+
+def collect_view_metrics() -> None:
+    furniture_views_pending.set(value=len(view_counter))
+
+
+register_collector(collect_view_metrics)